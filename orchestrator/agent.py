@@ -0,0 +1,167 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Agent keeping the keepass database unlocked between runs
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger, basicConfig, INFO
+from os import path, makedirs, chmod, remove, umask, getuid
+from json import dumps, loads
+from struct import calcsize, unpack
+from threading import Thread, Lock
+from time import monotonic
+from argparse import ArgumentParser
+from socket import socket, AF_UNIX, SOCK_STREAM, SOL_SOCKET, timeout
+
+# Peer credentials are only available on linux
+try :
+    from socket import SO_PEERCRED
+except ImportError :
+    SO_PEERCRED = None
+
+# Local includes
+from orchestrator.config import Configuration
+from orchestrator.vault import default_socket
+
+# Logging configuration
+log = getLogger('agent')
+
+# pylint: disable=C0301, C0321
+class VaultAgent :
+    """ Class unlocking a keepass database once and serving its entries by path over a unix socket
+    restricted to the current user """
+
+    m_configuration = None
+    m_database      = None
+    m_socket_path   = None
+    m_idle_timeout  = None
+    m_last_activity = None
+    m_lock          = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_configuration    = Configuration()
+        self.m_database         = None
+        self.m_socket_path      = None
+        self.m_idle_timeout     = 900
+        self.m_last_activity    = monotonic()
+        self.m_lock             = Lock()
+
+    def serve(self, database, key, socket_path = None, idle_timeout = 900) :
+        """ Unlock the database and serve its entries until the agent stays idle for too long
+        ---
+        database     (str) : The keepass database to serve
+        key          (str) : The keepass database key file or the environment variable containing its master key
+        socket_path  (str) : Unix socket to listen on (default socket if None)
+        idle_timeout (int) : Number of seconds without request after which the agent stops
+        """
+
+        is_status_ok = True
+        server = None
+
+        try :
+            self.m_database = path.realpath(database)
+            self.m_socket_path = socket_path
+            if self.m_socket_path is None : self.m_socket_path = default_socket()
+            self.m_idle_timeout = idle_timeout
+
+            if not self.m_configuration.load_secrets(database, key, '') : raise Exception('Unable to open database ' + database)
+
+            # Only the current user may access the socket directory and the socket itself
+            makedirs(path.dirname(self.m_socket_path), mode=0o700, exist_ok=True)
+            chmod(path.dirname(self.m_socket_path), 0o700)
+            if path.exists(self.m_socket_path) : remove(self.m_socket_path)
+            mask = umask(0o177)
+            try :
+                server = socket(AF_UNIX, SOCK_STREAM)
+                server.bind(self.m_socket_path)
+            finally :
+                umask(mask)
+            chmod(self.m_socket_path, 0o600)
+            server.listen()
+            server.settimeout(1)
+            log.info('Serving %s on %s', database, self.m_socket_path)
+
+            self.m_last_activity = monotonic()
+            while monotonic() - self.m_last_activity < self.m_idle_timeout :
+                try :
+                    (connection, _) = server.accept()
+                    Thread(target=self.handle, args=(connection,), daemon=True).start()
+                except timeout :
+                    pass
+            log.info('Stopping after %d seconds without request', self.m_idle_timeout)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        finally :
+            if server is not None :
+                server.close()
+                if path.exists(self.m_socket_path) : remove(self.m_socket_path)
+
+        return is_status_ok
+
+    def handle(self, connection) :
+        """ Answer the requests of a client until it disconnects
+        ---
+        connection (socket) : Client connection
+        """
+
+        try :
+            if SO_PEERCRED is not None :
+                (_, uid, _) = unpack('3i', connection.getsockopt(SOL_SOCKET, SO_PEERCRED, calcsize('3i')))
+                if uid != getuid() : raise Exception('Rejecting connection from user ' + str(uid))
+
+            with connection.makefile('r', encoding='UTF-8') as reader :
+                for line in reader :
+                    with self.m_lock : self.m_last_activity = monotonic()
+                    connection.sendall((dumps(self.answer(loads(line))) + '\n').encode('UTF-8'))
+
+        except Exception as exc :
+            log.error(str(exc))
+
+        finally :
+            connection.close()
+
+    def answer(self, request) :
+        """ Build the response to a request
+        ---
+        request (dict) : Client request, with the database it expects and either ping or the entry path and feature
+        ---
+        Returns (dict) : Response with the entry feature value (value) or an error message (error)
+        """
+
+        result = {}
+
+        if request.get('database') != self.m_database : result['error'] = 'Agent does not serve database ' + str(request.get('database'))
+        elif request.get('ping', False)               : result['ok'] = True
+        else :
+            entry = self.m_configuration.m_index.get(request.get('path'))
+            if entry is None : result['error'] = 'Entry ' + str(request.get('path')) + ' not found'
+            else :
+                value = getattr(entry, str(request.get('feature')), None)
+                if value is not None and not isinstance(value, str) : result['error'] = 'Unmanaged feature ' + str(request.get('feature'))
+                else : result['value'] = value
+
+        return result
+
+if __name__ == '__main__' :
+
+    parser = ArgumentParser(description='Keep a keepass database unlocked for orchestrator runs')
+    parser.add_argument('--database', default='database.kdbx', help='Keepass database filename')
+    parser.add_argument('--key', default='database.keyx', help='Keepass database key file or master key environment variable name')
+    parser.add_argument('--socket', default=None, help='Unix socket to listen on')
+    parser.add_argument('--idle-timeout', type=int, default=900, help='Number of seconds without request after which the agent stops')
+    arguments = parser.parse_args()
+
+    basicConfig(level=INFO)
+    if not VaultAgent().serve(arguments.database, arguments.key, arguments.socket, arguments.idle_timeout) : raise SystemExit(1)
+# pylint: enable=C0301, C0321
@@ -0,0 +1,79 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to allocate cidr ranges in a network
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from bisect import bisect_right
+
+# pylint: disable=C0301, C0321
+class Allocator :
+    """ Class allocating cidr ranges from the free address intervals of a network """
+
+    m_network   = None
+    m_starts    = None
+    m_ends      = None
+
+    def __init__(self, network) :
+        """ Constructor
+        ---
+        network (IPv4Network) : Network in which ranges are allocated
+        """
+        self.m_network  = network
+        self.m_starts   = [int(network.network_address)]
+        self.m_ends     = [int(network.broadcast_address) + 1]
+
+    def reserve(self, network) :
+        """ Remove a range from the free intervals
+        ---
+        network (IPv4Network) : Range already in use
+        """
+
+        start = max(int(network.network_address), int(self.m_network.network_address))
+        end = min(int(network.broadcast_address) + 1, int(self.m_network.broadcast_address) + 1)
+
+        # Free intervals are disjoint and sorted, so only the ones around the range are concerned
+        index = max(0, bisect_right(self.m_starts, start) - 1)
+        while start < end and index < len(self.m_starts) and self.m_starts[index] < end :
+            if self.m_ends[index] <= start : index = index + 1
+            else :
+                (low, high) = (self.m_starts[index], self.m_ends[index])
+                del self.m_starts[index]
+                del self.m_ends[index]
+                if high > end :
+                    self.m_starts.insert(index, end)
+                    self.m_ends.insert(index, high)
+                if low < start :
+                    self.m_starts.insert(index, low)
+                    self.m_ends.insert(index, start)
+                    index = index + 1
+                if high > end : index = index + 1
+
+    def allocate(self, prefix) :
+        """ Allocate the lowest free range with a given mask
+        ---
+        prefix  (int)         : Mask of the range to allocate
+        ---
+        Returns (IPv4Network) : Allocated range, None if no free range is large enough
+        """
+
+        result = None
+        size = 1 << (self.m_network.max_prefixlen - prefix)
+
+        index = 0
+        while result is None and index < len(self.m_starts) :
+            aligned = -(-self.m_starts[index] // size) * size
+            if aligned + size <= self.m_ends[index] : result = type(self.m_network)((aligned, prefix))
+            index = index + 1
+
+        if result is not None : self.reserve(result)
+
+        return result
+# pylint: enable=C0301, C0321
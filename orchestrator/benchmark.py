@@ -0,0 +1,326 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Benchmarks of the orchestrator building blocks
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger, basicConfig, WARNING, INFO
+from os import path, makedirs, environ, chmod, pathsep
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from platform import python_version
+from argparse import ArgumentParser
+from importlib.metadata import version, PackageNotFoundError
+from unittest.mock import patch
+
+# Aws includes
+from boto3 import Session
+
+# Pykeepass includes
+from pykeepass import create_database
+
+# Local includes
+from orchestrator.utils import load_and_parse_json_file, dump_json_file
+from orchestrator.orchestrator import Orchestrator
+from orchestrator.config import Configuration
+from orchestrator.networks import Networks
+from orchestrator.buckets import Buckets
+
+# Local AWS stand-in, only needed by the networks and buckets benchmarks
+try :
+    from moto import mock_aws
+except ImportError :
+    mock_aws = None
+
+# Logging configuration
+log = getLogger('benchmark')
+
+# Stub terraform executable, counting its calls and simulating terraform latency
+TERRAFORM_STUB = '''#!/bin/sh
+echo "$1" >> "{calls}"
+if [ -n "$TF_DATA_DIR" ] ; then mkdir -p "$TF_DATA_DIR" ; fi
+sleep {latency}
+exit 0
+'''
+
+# Master key of the generated keepass databases, only set in the environment while used
+VAULT_KEY = 'ORCHESTRATOR_BENCHMARK_KEY'
+VAULT_PASSWORD = 'benchmark'
+
+# pylint: disable=C0301, C0321
+class Benchmark :
+    """ Class measuring the orchestrator performances on synthetic workloads, with a stub terraform
+    executable and a local AWS stand-in, and comparing them with the results of another version """
+
+    m_directory = None
+    m_region    = 'us-east-1'
+    m_metrics   = None
+
+    def __init__(self, directory) :
+        """ Constructor
+        ---
+        directory (str) : Scratch directory in which benchmark data are generated
+        """
+        self.m_directory    = directory
+        self.m_region       = 'us-east-1'
+        self.m_metrics      = {}
+
+    def get_metrics(self) :
+        """ Metrics accessor
+        ---
+        Returns (dict) : Measured durations in seconds, by metric name (lower is better)
+        """
+
+        result = self.m_metrics
+
+        return result
+
+    def create_vault(self, filename, secrets = 0) :
+        """ Create a keepass database with AWS credentials and secrets
+        ---
+        filename (str) : Keepass database to create
+        secrets  (int) : Number of secret entries to create in the benchmark group
+        """
+
+        database = create_database(filename, password=VAULT_PASSWORD)
+        group = database.add_group(database.add_group(database.root_group, 'engineering-environment'), 'aws')
+        database.add_entry(group, 'aws-benchmark-access-key', 'testing', 'testing')
+        group = database.add_group(database.root_group, 'benchmark')
+        for i_secret in range(secrets) : database.add_entry(group, 'secret-' + str(i_secret), 'user-' + str(i_secret), 'password-' + str(i_secret))
+        database.save()
+
+    def workflow(self, steps, latency) :
+        """ Measure the orchestration overhead of a workflow of single task steps
+        ---
+        steps   (int)   : Number of steps of the workflow
+        latency (float) : Duration in seconds of each stub terraform command
+        """
+
+        is_status_ok = True
+
+        try :
+            root = self.m_directory + '/workflow'
+            makedirs(root + '/conf')
+            makedirs(root + '/bin')
+
+            # Stub terraform executable, found first in the path
+            calls = root + '/calls'
+            with open(root + '/bin/terraform', 'w', encoding='UTF-8') as fid : fid.write(TERRAFORM_STUB.format(calls=calls, latency=latency))
+            chmod(root + '/bin/terraform', 0o755)
+
+            # Synthetic deployment
+            workflow = {}
+            for i_step in range(steps) :
+                makedirs(root + '/terraform/step' + str(i_step))
+                with open(root + '/terraform/step' + str(i_step) + '/main.tf', 'w', encoding='UTF-8') as fid : fid.write('resource "null_resource" "step' + str(i_step) + '" {}\n')
+                workflow['step' + str(i_step)] = {'description' : 'Step ' + str(i_step), 'tasks' : [{'description' : 'Task ' + str(i_step), 'type' : 'terraform', 'path' : 'step' + str(i_step), 'state' : 'step' + str(i_step)}]}
+            dump_json_file(workflow, root + '/conf/deployment.json')
+            dump_json_file(workflow, root + '/conf/destruction.json')
+            dump_json_file({}, root + '/conf/subnets.json')
+            dump_json_file({'git' : {'none' : {'type' : 'value', 'value' : ''}}}, root + '/conf/keys.json')
+            dump_json_file({ \
+                'parameters' : {'topic' : 'benchmark', 'region' : self.m_region, 'contact' : 'benchmark@example.com'}, \
+                'paths' : {'states' : '../states', 'terraform' : '../terraform'}, \
+                'workflows' : {'deployment' : 'deployment.json', 'destruction' : 'destruction.json', 'subnets' : 'subnets.json', 'keys' : 'keys.json'}}, root + '/conf/conf.json')
+            self.create_vault(root + '/conf/vault.kdbx')
+
+            # The stub terraform is found first in the path, and the vault key is set, during the runs only
+            with patch.dict(environ, {'PATH' : root + '/bin' + pathsep + environ['PATH'], VAULT_KEY : VAULT_PASSWORD}) :
+                # The first run initializes terraform, the next one reuses the initialization
+                for name in ['workflow.first_run_overhead_per_task', 'workflow.overhead_per_task'] :
+                    with open(calls, 'w', encoding='UTF-8') as fid : fid.write('')
+                    orchestrator = Orchestrator('benchmark')
+                    if is_status_ok : is_status_ok = orchestrator.configure(root + '/conf/conf.json', 'benchmark')
+                    if is_status_ok : is_status_ok = orchestrator.workflow(root + '/conf/vault.kdbx', VAULT_KEY, [], 'benchmark')
+                    if not is_status_ok : raise Exception('Workflow failed')
+                    with open(calls, 'r', encoding='UTF-8') as fid : commands = len(fid.readlines())
+                    # Vault opening is measured by the secrets benchmark, so only the steps execution is considered
+                    duration = sum(record['duration'] for record in orchestrator.m_timings.get_records() if record['kind'] == 'workflow')
+                    self.m_metrics[name] = (duration - commands * latency) / steps
+                    log.info('%s : %.4fs (%d steps, %d terraform commands in %.2fs)', name, self.m_metrics[name], steps, commands, duration)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def networks(self, counts) :
+        """ Measure the cidr ranges allocation duration depending on the number of subnets
+        ---
+        counts (list) : Numbers of subnets to allocate, half of them being already deployed
+        """
+
+        is_status_ok = True
+
+        try :
+            with mock_aws() :
+                client = Session(aws_access_key_id='testing', aws_secret_access_key='testing', region_name=self.m_region).client('ec2')
+                for count in counts :
+                    vpc = client.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+                    subnets = {'benchmark' : {'subnets' : []}}
+                    for i_subnet in range(count) :
+                        subnets['benchmark']['subnets'].append({'name' : 'subnet-' + str(i_subnet), 'mask' : 28, 'region' : self.m_region, 'subregion' : 'a'})
+                        if i_subnet % 2 == 0 :
+                            client.create_subnet(VpcId=vpc, CidrBlock='10.0.' + str(i_subnet // 16) + '.' + str((i_subnet % 16) * 16) + '/28', \
+                                TagSpecifications=[{'ResourceType' : 'subnet', 'Tags' : [{'Key' : 'DeployIdentifier', 'Value' : 'subnet-' + str(i_subnet)}]}])
+                    state = self.m_directory + '/network-' + str(count) + '.tfstate'
+                    dump_json_file({'outputs' : {'vpc' : {'value' : {'cidr' : '10.0.0.0/16', 'id' : vpc}}}}, state)
+
+                    networks = Networks()
+                    if is_status_ok : is_status_ok = networks.configure('testing', 'testing', self.m_region, False, subnets)
+                    start = perf_counter()
+                    if is_status_ok : is_status_ok = networks.compute(state)
+                    if not is_status_ok : raise Exception('Networks computation failed')
+                    self.m_metrics['networks.compute.' + str(count)] = perf_counter() - start
+                    log.info('networks.compute.%d : %.4fs', count, self.m_metrics['networks.compute.' + str(count)])
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def buckets(self, versions) :
+        """ Measure the bucket emptying throughput
+        ---
+        versions (int) : Number of object versions to create in the bucket before emptying it
+        """
+
+        is_status_ok = True
+
+        try :
+            with mock_aws() :
+                client = Session(aws_access_key_id='testing', aws_secret_access_key='testing', region_name=self.m_region).client('s3')
+                client.create_bucket(Bucket='benchmark')
+                client.put_bucket_versioning(Bucket='benchmark', VersioningConfiguration={'Status' : 'Enabled'})
+                for i_version in range(versions) : client.put_object(Bucket='benchmark', Key='object-' + str(i_version % 100), Body=b'benchmark')
+
+                buckets = Buckets()
+                buckets.configure('testing', 'testing', self.m_region)
+                start = perf_counter()
+                if is_status_ok : is_status_ok = buckets.empty_bucket('benchmark', self.m_region)
+                if not is_status_ok : raise Exception('Bucket emptying failed')
+                self.m_metrics['buckets.seconds_per_million_versions'] = (perf_counter() - start) / versions * 1000000
+                log.info('buckets.seconds_per_million_versions : %.1fs', self.m_metrics['buckets.seconds_per_million_versions'])
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def secrets(self, count) :
+        """ Measure the secrets resolution cost
+        ---
+        count (int) : Number of secrets to resolve
+        """
+
+        is_status_ok = True
+
+        try :
+            self.create_vault(self.m_directory + '/secrets.kdbx', count)
+
+            configuration = Configuration()
+            configuration.m_workflows = {'keys' : {'benchmark' : {}}}
+            for i_secret in range(count) :
+                configuration.m_workflows['keys']['benchmark']['secret' + str(i_secret)] = {'type' : 'secret', 'entry' : {'key' : 'benchmark/secret-' + str(i_secret), 'feature' : 'password'}}
+
+            # The vault agent is not used, to measure the database itself
+            start = perf_counter()
+            with patch.dict(environ, {VAULT_KEY : VAULT_PASSWORD}) :
+                if is_status_ok : is_status_ok = configuration.load_secrets(self.m_directory + '/secrets.kdbx', VAULT_KEY, '')
+            self.m_metrics['secrets.load'] = perf_counter() - start
+            start = perf_counter()
+            if is_status_ok : is_status_ok = configuration.set_parameters()
+            if not is_status_ok : raise Exception('Secrets resolution failed')
+            self.m_metrics['secrets.seconds_per_secret'] = (perf_counter() - start) / count
+            log.info('secrets.load : %.4fs', self.m_metrics['secrets.load'])
+            log.info('secrets.seconds_per_secret : %.6fs (%d secrets)', self.m_metrics['secrets.seconds_per_secret'], count)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def compare(self, baseline, threshold) :
+        """ Compare the metrics with the results of a previous benchmark
+        ---
+        baseline  (dict)  : Results of the previous benchmark
+        threshold (float) : Relative slowdown above which a metric is reported as a regression
+        ---
+        Returns   (bool)  : True if no metric regressed
+        """
+
+        result = True
+
+        for name in sorted(self.m_metrics) :
+            if name in baseline['metrics'] and baseline['metrics'][name] > 0 :
+                ratio = self.m_metrics[name] / baseline['metrics'][name]
+                if ratio > 1 + threshold :
+                    log.error('%s regressed : %.6f against %.6f (x%.2f)', name, self.m_metrics[name], baseline['metrics'][name], ratio)
+                    result = False
+                else : log.info('%s : %.6f against %.6f (x%.2f)', name, self.m_metrics[name], baseline['metrics'][name], ratio)
+
+        return result
+# pylint: enable=C0301, C0321
+
+# pylint: disable=C0301, C0321
+def main() :
+    """ Run the benchmarks from the command line
+    ---
+    Returns (int) : Process exit code, 1 if a benchmark failed or a metric regressed
+    """
+
+    parser = ArgumentParser(description='Benchmark the orchestrator building blocks')
+    parser.add_argument('--steps', type=int, default=20, help='Number of steps of the synthetic workflow')
+    parser.add_argument('--latency', type=float, default=0.05, help='Duration in seconds of each stub terraform command')
+    parser.add_argument('--subnets', default='16,64,256', help='Comma separated numbers of subnets to allocate')
+    parser.add_argument('--versions', type=int, default=2000, help='Number of object versions of the emptied bucket')
+    parser.add_argument('--secrets', type=int, default=500, help='Number of secrets to resolve')
+    parser.add_argument('--only', default='workflow,networks,buckets,secrets', help='Comma separated benchmarks to run')
+    parser.add_argument('--output', default=None, help='Json file to write results into')
+    parser.add_argument('--compare', default=None, help='Json results of a previous benchmark to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative slowdown reported as a regression')
+    parser.add_argument('--verbose', action='store_true', help='Show the orchestrator logs')
+    arguments = parser.parse_args()
+
+    basicConfig(level=INFO if arguments.verbose else WARNING)
+    log.setLevel(INFO)
+
+    is_status_ok = True
+    benchmarks = arguments.only.split(',')
+
+    try :
+        package = version('orchestrator')
+    except PackageNotFoundError :
+        package = 'unknown'
+
+    with TemporaryDirectory() as directory :
+        benchmark = Benchmark(directory)
+        if mock_aws is None and ('networks' in benchmarks or 'buckets' in benchmarks) :
+            log.warning('moto is not installed - skipping networks and buckets benchmarks (pip install orchestrator[benchmark])')
+            benchmarks = [name for name in benchmarks if name not in ('networks', 'buckets')]
+        if 'workflow' in benchmarks and not benchmark.workflow(arguments.steps, arguments.latency) : is_status_ok = False
+        if 'networks' in benchmarks and not benchmark.networks([int(count) for count in arguments.subnets.split(',')]) : is_status_ok = False
+        if 'buckets' in benchmarks and not benchmark.buckets(arguments.versions) : is_status_ok = False
+        if 'secrets' in benchmarks and not benchmark.secrets(arguments.secrets) : is_status_ok = False
+
+    results = {'version' : package, 'python' : python_version(), 'parameters' : vars(arguments), 'metrics' : benchmark.get_metrics()}
+    if arguments.output is not None : dump_json_file(results, arguments.output)
+    if arguments.compare is not None and path.isfile(arguments.compare) :
+        if not benchmark.compare(load_and_parse_json_file(arguments.compare), arguments.threshold) : is_status_ok = False
+
+    return 0 if is_status_ok else 1
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    raise SystemExit(main())
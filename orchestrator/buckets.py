@@ -13,16 +13,24 @@
 # System includes
 from logging import getLogger
 from os import path
+from time import perf_counter
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
 
 # Aws includes
 from boto3 import Session
+from boto3.s3.transfer import TransferConfig
 
 # Local includes
-from orchestrator.utils import load_and_parse_json_file
+from orchestrator.utils import load_and_parse_json_file, dump_json_file, load_state_outputs
 
 # Logging configuration
 log = getLogger('buckets')
 
+# Upload manifests may be shared by several orchestrators running at the same time
+manifest_lock = Lock()
+
 class Buckets :
     """ Class containing methods to manage S3 buckets """
 
@@ -30,14 +38,27 @@ class Buckets :
     m_client = None
     m_username = None
     m_password = None
+    m_clients = None
+    m_lock = None
+    m_max_workers = 8
+    m_max_buckets = 4
+    m_batch_size = 1000
+    m_transfer = None
 
     def __init__(self) :
         """ Constructor """
         self.m_session = None
         self.m_client = None
-        self.m_ec2_client = None
         self.m_username = None
         self.m_password = None
+        self.m_clients = {}
+        self.m_lock = Lock()
+        self.m_max_workers = 8
+        self.m_max_buckets = 4
+        self.m_batch_size = 1000
+        # Large states are uploaded in concurrent parts
+        self.m_transfer = TransferConfig(multipart_threshold=16 * 1024 * 1024, \
+            multipart_chunksize=16 * 1024 * 1024, max_concurrency=4)
 
 # pylint: disable=C0301
     def configure(self, username, password, region) :
@@ -52,7 +73,7 @@ class Buckets :
         try :
             self.m_session = Session(aws_access_key_id=username, aws_secret_access_key=password, region_name=region)
             self.m_client = self.m_session.client('s3')
-            self.m_ec2_client = self.m_session.client('ec2')
+            self.m_clients = {region : self.m_client}
             self.m_username = username
             self.m_password = password
 
@@ -67,23 +88,23 @@ class Buckets :
     def empty_buckets(self, state, account, principal) :
         """ Lock and empty an S3 bucket
         ---
-        state     (str) : Terraform state file to retrieve buckets from
-        account   (str) : AWS accounts in which buckets are located
-        principal (str) : AWS user to limit bucket access to when locked
+        state     (str / dict) : Terraform state file, or its outputs, to retrieve buckets from
+        account   (str)        : AWS accounts in which buckets are located
+        principal (str)        : AWS user to limit bucket access to when locked
         """
 
         is_status_ok = True
 
         try :
 
-            if is_status_ok : state_logging = load_and_parse_json_file(state)
-            if is_status_ok : regions = self.m_ec2_client.describe_regions()
+            if is_status_ok and isinstance(state, dict) : outputs = state
+            elif is_status_ok : outputs = load_state_outputs(state)
 
             if is_status_ok :
-                for bucket in state_logging['outputs']['buckets']['value'] :
-                    self.lock_bucket(state_logging['outputs']['buckets']['value'][bucket]['id'], account, principal)
-                    for region in regions['Regions'] :
-                        if is_status_ok : is_status_ok = self.empty_bucket(state_logging['outputs']['buckets']['value'][bucket]['id'], region['RegionName'])
+                buckets = [outputs['buckets']['value'][bucket]['id'] for bucket in outputs['buckets']['value']]
+                with ThreadPoolExecutor(max_workers=self.m_max_buckets) as executor :
+                    statuses = list(executor.map(lambda bucket : self.lock_and_empty_bucket(bucket, account, principal), buckets))
+                is_status_ok = all(statuses)
 
         except Exception as exc :
             log.error(str(exc))
@@ -92,21 +113,78 @@ class Buckets :
         return is_status_ok
 # pylint: enable=C0301, C0321
 
-# pylint: disable=C0301
-    def lock_bucket(self, bucket, account, principal) :
+    def lock_and_empty_bucket(self, bucket, account, principal) :
+        """ Lock and empty a bucket in its own region
+        ---
+        bucket       (str) : Bucket to lock and empty
+        account      (str) : AWS accounts in which buckets are located
+        principal    (str) : AWS user to limit bucket access to when locked
+        """
+
+        is_status_ok = True
+
+        try :
+            region = self.get_region(bucket)
+            self.lock_bucket(bucket, account, principal, region)
+            is_status_ok = self.empty_bucket(bucket, region)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+# pylint: disable=C0301, C0321
+    def get_region(self, bucket) :
+        """ Retrieve the region of a bucket
+        ---
+        bucket  (str) : Bucket to locate
+        ---
+        Returns (str) : Bucket region
+        """
+
+        result = self.m_client.get_bucket_location(Bucket=bucket)['LocationConstraint']
+
+        # Buckets created in us-east-1 have no location constraint, legacy ones may use EU
+        if result is None or result == '' : result = 'us-east-1'
+        elif result == 'EU'                : result = 'eu-west-1'
+
+        return result
+
+    def get_client(self, region) :
+        """ Retrieve the s3 client for a region, creating it on first use
+        ---
+        region  (str)    : Region to address
+        ---
+        Returns (Client) : S3 client for the region
+        """
+
+        with self.m_lock :
+            if not region in self.m_clients : self.m_clients[region] = self.m_session.client('s3', region_name=region)
+            result = self.m_clients[region]
+
+        return result
+# pylint: enable=C0301, C0321
+
+# pylint: disable=C0301, C0321
+    def lock_bucket(self, bucket, account, principal, region = None) :
         """ Lock bucket access by only allowing a single user
         ---
         bucket       (str) : Bucket to lock
         account      (str) : AWS accounts in which buckets are located
         principal    (str) : AWS user to limit bucket access to when locked
+        region       (str) : Bucket region (session region if not provided)
         """
+        client = self.m_client
+        if region is not None : client = self.get_client(region)
         policy = '{"Version":"2012-10-17","Statement":[{"Sid":"AllowRootAndServicePrincipal","Effect":"Allow","Principal":{"AWS":["arn:aws:iam::' + account + ':user/' + principal + '","arn:aws:iam::' + account + ':root"]},"Action":"s3:*","Resource":["arn:aws:s3:::' + bucket + '/*","arn:aws:s3:::' + bucket +'"]}]}'
-        self.m_client.put_bucket_policy(Bucket=bucket, Policy=policy)
-# pylint: enable=C0301
+        client.put_bucket_policy(Bucket=bucket, Policy=policy)
+# pylint: enable=C0301, C0321
 
-# pylint: disable=C0301
+# pylint: disable=C0301, C0321, R0914
     def empty_bucket(self, bucket, region) :
-        """ Empty a bucket
+        """ Empty a bucket. Versions are listed a few batches at a time, then deleted before listing again from the
+        start of the bucket, so that the listing never resumes from a marker which has just been deleted
         ---
         bucket       (str) : Bucket to lock
         region       (str) : Bucket region*
@@ -116,53 +194,191 @@ class Buckets :
 
         try :
 
-            session = Session(aws_access_key_id=self.m_username, aws_secret_access_key=self.m_password, region_name=region)
-            client = session.client('s3')
-
-            paginator = client.get_paginator('list_object_versions')
-            response_iterator = paginator.paginate(Bucket=bucket)
-            for response in response_iterator :
-                if 'Versions' in response :
-                    for obj in response['Versions'] :
-                        log.debug(obj['Key'])
-                        self.m_client.delete_object(Bucket=bucket, Key=obj['Key'], VersionId=obj['VersionId'])
-                if 'DeleteMarkers' in response :
-                    for obj in response['DeleteMarkers'] :
-                        log.debug(obj['Key'])
-                        self.m_client.delete_object(Bucket=bucket, Key=obj['Key'], VersionId=obj['VersionId'])
+            client = self.get_client(region)
+
+            start = perf_counter()
+            deleted = 0
+            errors = []
+
+            with ThreadPoolExecutor(max_workers=self.m_max_workers) as executor :
+
+                batches = self.list_batches(client, bucket, 2 * self.m_max_workers)
+                while len(batches) > 0 and len(errors) == 0 :
+                    for (count, failures) in executor.map(lambda batch : self.delete_batch(client, bucket, batch), batches) :
+                        deleted = deleted + count
+                        errors = errors + failures
+                    if len(errors) == 0 : batches = self.list_batches(client, bucket, 2 * self.m_max_workers)
+
+            duration = perf_counter() - start
+            log.info('-------- Deleted %d objects from bucket %s in %.1fs (%.0f objects/s)', deleted, bucket, duration, deleted / duration if duration > 0 else 0)
+            for error in errors[:10] : log.error('Failed to delete %s (version %s) : %s', error['Key'], error.get('VersionId'), error['Message'])
+            if len(errors) > 0 : raise Exception(str(len(errors)) + ' objects could not be deleted from bucket ' + bucket)
 
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
-# pylint: enable=C0301
+# pylint: enable=R0914
+
+    def list_batches(self, client, bucket, count) :
+        """ List the first object versions and delete markers of a bucket, before any of them is deleted
+        ---
+        client  (Client) : S3 client of the bucket region
+        bucket  (str)    : Bucket to list objects from
+        count   (int)    : Maximum number of batches to list
+        ---
+        Returns (list)   : Batches of keys and versions of the objects to delete
+        """
+
+        result = []
+        batch = []
+
+        paginator = client.get_paginator('list_object_versions')
+        for response in paginator.paginate(Bucket=bucket, PaginationConfig={'PageSize' : self.m_batch_size}) :
+            for obj in response.get('Versions', []) + response.get('DeleteMarkers', []) :
+                batch.append({'Key' : obj['Key'], 'VersionId' : obj['VersionId']})
+                if len(batch) == self.m_batch_size :
+                    result.append(batch)
+                    batch = []
+            if len(result) >= count : break
+        if len(batch) > 0 : result.append(batch)
+
+        return result
+# pylint: enable=C0301, C0321
 
-    def upload_states(self, files, state_file) :
-        """ Upload states to an s3 bucket
+# pylint: disable=R0201
+    def delete_batch(self, client, bucket, batch) :
+        """ Delete a batch of object versions
         ---
-        files       (str) : List of state files to upload
-        state_file  (str) : Terraform state file from which bucket path shall be read
+        client  (Client)    : S3 client of the bucket region
+        bucket  (str)       : Bucket to delete objects from
+        batch   (list)      : Keys and versions of the objects to delete (1000 at most)
+        ---
+        Returns (tuple)     : Number of deleted objects and errors returned for the others
+        """
+
+        response = client.delete_objects(Bucket=bucket, \
+            Delete={'Objects' : batch, 'Quiet' : True})
+        errors = response.get('Errors', [])
+        result = (len(batch) - len(errors), errors)
+
+        return result
+# pylint: enable=R0201
+
+# pylint: disable=C0301, C0321, R0914
+    def upload_states(self, files, state_file, manifest = None) :
+        """ Upload states to an s3 bucket, skipping the files that did not change since their last upload
+        ---
+        files       (str)        : List of state files to upload
+        state_file  (str / dict) : Terraform state file, or its outputs, from which bucket path shall be read
+        manifest    (str)        : File keeping the hashes and etags of the uploaded files (None to upload every file)
         """
 
         is_status_ok = True
 
         try :
              # Retrieve s3 backend configuration from state file
-            state_backend = load_and_parse_json_file(state_file)
-            bucket = state_backend['outputs']['buckets']['value']['backend']['id']
-            s3_path = state_backend['outputs']['bucket_terraform_key']['value']
+            outputs = state_file
+            if not isinstance(state_file, dict) : outputs = load_state_outputs(state_file)
+            bucket = outputs['buckets']['value']['backend']['id']
+            s3_path = outputs['bucket_terraform_key']['value']
 
             log.debug('-------- Bucket : %s', bucket)
-            log.debug('-------- Path : %s', path)
+            log.debug('-------- Path : %s', s3_path)
+
+            uploads = {}
+            with manifest_lock :
+                if manifest is not None and path.isfile(manifest) : uploads = load_and_parse_json_file(manifest)
+
+            # Retrieve the etags of the states already in the backend
+            etags = {}
+            paginator = self.m_client.get_paginator('list_objects_v2')
+            for response in paginator.paginate(Bucket=bucket, Prefix=s3_path) :
+                for obj in response.get('Contents', []) : etags[obj['Key']] = obj['ETag']
 
-            # Upload existing states to s3 backend
+            # Only upload files which content changed locally or in the backend
+            changes = []
             for file in files :
                 target = s3_path + path.basename(file)
-                self.m_client.upload_file(file, bucket, target)
+                digest = self.hash_file(file)
+                entry = uploads.get(bucket + '/' + target)
+                if entry is None or entry['sha256'] != digest or etags.get(target) != entry['etag'] : changes.append((file, target, digest))
+            log.info('-------- Uploading %d changed states out of %d', len(changes), len(files))
+
+            with ThreadPoolExecutor(max_workers=self.m_max_workers) as executor :
+                results = list(executor.map(lambda change : self.upload_state(change[0], bucket, change[1]), changes))
+
+            # Reload the manifest before updating it, to keep the uploads recorded in the meantime
+            with manifest_lock :
+                if manifest is not None and path.isfile(manifest) : uploads = load_and_parse_json_file(manifest)
+                for index, (file, target, digest) in enumerate(changes) :
+                    uploads[bucket + '/' + target] = {'sha256' : digest, 'etag' : results[index]}
+                if manifest is not None : dump_json_file(uploads, manifest)
 
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
+# pylint: enable=C0301, C0321, R0914
+
+    def upload_state(self, file, bucket, target) :
+        """ Upload a state to an s3 bucket
+        ---
+        file    (str) : State file to upload
+        bucket  (str) : Bucket to upload file into
+        target  (str) : Object key of the uploaded file
+        ---
+        Returns (str) : Etag of the uploaded object
+        """
+
+        log.debug('-------- Uploading %s to %s', file, target)
+        self.m_client.upload_file(file, bucket, target, Config=self.m_transfer)
+        result = self.m_client.head_object(Bucket=bucket, Key=target)['ETag']
+
+        return result
+
+# pylint: disable=C0321
+    def read_object_head(self, bucket, key, region = None, size = 4096) :
+        """ Read the first bytes of an object, without downloading it entirely
+        ---
+        bucket  (str)   : Bucket hosting the object
+        key     (str)   : Object key
+        region  (str)   : Bucket region (session region if not provided)
+        size    (int)   : Number of bytes to read
+        ---
+        Returns (bytes) : First bytes of the object, None if the object does not exist
+        """
+
+        result = None
+
+        client = self.m_client
+        if region is not None : client = self.get_client(region)
+
+        try :
+            response = client.get_object(Bucket=bucket, Key=key, Range='bytes=0-' + str(size - 1))
+            result = response['Body'].read()
+        except client.exceptions.NoSuchKey :
+            log.debug('-------- Object %s not found in bucket %s', key, bucket)
+            result = None
+
+        return result
+# pylint: enable=C0321
+
+# pylint: disable=R0201, C0321
+    def hash_file(self, file) :
+        """ Hash a file content
+        ---
+        file    (str) : File to hash
+        ---
+        Returns (str) : Sha256 digest of the file content
+        """
+
+        digest = sha256()
+        with open(file, 'rb') as fid :
+            for chunk in iter(lambda : fid.read(1 << 20), b'') : digest.update(chunk)
+        result = digest.hexdigest()
+
+        return result
+# pylint: enable=R0201, C0321
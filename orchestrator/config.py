@@ -14,6 +14,8 @@
 from logging import getLogger
 from os import path, makedirs, getenv
 from json import dumps
+from time import perf_counter
+from copy import deepcopy
 
 # Pykeepass includes
 from pykeepass import PyKeePass
@@ -21,6 +23,8 @@ from pykeepass.exceptions import CredentialsError
 
 # Local includes
 from orchestrator.utils import load_and_parse_json_file
+from orchestrator.vault import VaultClient
+from orchestrator.scheduler import Scheduler
 
 # Logging configuration
 log = getLogger('config')
@@ -33,6 +37,8 @@ class Configuration :
     m_configuration_path        = None
 
     m_keepass                   = None
+    m_index                     = None
+    m_agent                     = None
 
     m_parameters                = None
     m_secrets                   = None
@@ -47,6 +53,8 @@ class Configuration :
         self.m_configuration_path   = None
 
         self.m_keepass              = None
+        self.m_index                = {}
+        self.m_agent                = None
         self.m_aws_ad_domain        = None
         self.m_aws_ad_password      = None
 
@@ -101,6 +109,17 @@ class Configuration :
 
         return result
 
+    def get_backend(self) :
+        """ S3 backend accessor
+        ---
+        Returns (dict) : S3 backend bucket, path and region, None if the configuration file sets no s3 backend
+        """
+
+        result = None
+        if 'backend' in self.m_configuration : result = self.m_configuration['backend']
+
+        return result
+
     def get_parameter(self, topic):
         """ Parameters (secrets and non secrets) accessor
         ---
@@ -171,22 +190,37 @@ class Configuration :
 
         return is_status_ok
 
-    def load_secrets(self, database, key) :
+    def load_secrets(self, database, key, agent = None) :
         """ Read deployment secrets from keepass database
         ---
         database (str) : The input keepass database to extract values from
         key      (str) : The input keepass database key file or master key
+        agent    (str) : Socket of the vault agent to use when it is running (default socket if None, empty to open the database directly)
         """
         is_status_ok = True
 
         try:
-            if path.isfile(key) :
+            # Use the vault agent when it is running, to avoid unlocking the database again
+            client = VaultClient(agent)
+            if client.connect(database) :
+                log.debug('Reading secrets from vault agent on %s', client.m_socket_path)
+                self.m_agent = client
+            elif path.isfile(key) :
                 log.debug('Opening database with keyfile')
                 self.m_keepass = PyKeePass(database, keyfile=key)
             else :
                 log.debug('Opening database with master key in environment variable %s', key)
                 self.m_keepass = PyKeePass(database, password=getenv(key))
 
+            # Index entries by path once, instead of walking the tree for each secret
+            if self.m_keepass is not None :
+                start = perf_counter()
+                self.m_index = {}
+                for entry in self.m_keepass.entries :
+                    entry_path = entry.path
+                    if entry_path is not None and None not in entry_path : self.m_index.setdefault('/'.join(entry_path), entry)
+                log.debug('Indexed %d vault entries in %.3fs', len(self.m_index), perf_counter() - start)
+
         except CredentialsError as exc :
             log.error('Credentials error : %s',str(exc))
             is_status_ok = False
@@ -196,6 +230,38 @@ class Configuration :
 
         return is_status_ok
 
+    def clone(self, env) :
+        """ Copy the configuration for another environment, without reading files and secrets again
+        ---
+        env     (str)           : platform deployment stage to address
+        ---
+        Returns (Configuration) : Configuration with its own workflows and parameters, sharing the vault
+        """
+
+        result = Configuration()
+
+        result.m_configuration_path = self.m_configuration_path
+        result.m_configuration      = deepcopy(self.m_configuration)
+        result.m_configuration['parameters']['environment'] = env
+        result.m_paths              = dict(self.m_paths)
+
+        # Workflows are modified during deployment (subnets cidr ranges), so each environment gets its own
+        result.m_workflows          = deepcopy(self.m_workflows)
+
+        # The vault is shared, since it is only read
+        result.m_keepass            = self.m_keepass
+        result.m_index              = self.m_index
+        result.m_agent              = self.m_agent
+
+        # Parameters already resolved are kept, with the new environment
+        result.m_parameters         = deepcopy(self.m_parameters)
+        result.m_secrets            = deepcopy(self.m_secrets)
+        result.m_non_secrets        = deepcopy(self.m_non_secrets)
+        if 'global' in result.m_parameters : result.m_parameters['global']['environment'] = env
+        if 'global' in result.m_non_secrets : result.m_non_secrets['global']['environment'] = env
+
+        return result
+
     def set_parameters(self, username = None) :
         """ Gather parameters from different sources
         ---
@@ -209,15 +275,10 @@ class Configuration :
             # Reading aws credentials from database
             if username is not None :
                 lpath = ['engineering-environment','aws','aws-' + username + '-access-key']
-                entry = self.m_keepass.find_entries_by_path(lpath)
-                if entry is None :
-                    raise Exception('Entry ' + '/'.join(lpath) + ' not found')
                 self.m_parameters['aws'] = {}
-                self.m_parameters['aws']['username'] = getattr(entry,'username')
-                self.m_parameters['aws']['password'] = getattr(entry,'password')
-                self.m_secrets['aws'] = {}
-                self.m_secrets['aws']['username'] = getattr(entry,'username')
-                self.m_secrets['aws']['password'] = getattr(entry,'password')
+                self.m_parameters['aws']['username'] = self.read_secret({'key' : '/'.join(lpath), 'feature' : 'username'})
+                self.m_parameters['aws']['password'] = self.read_secret({'key' : '/'.join(lpath), 'feature' : 'password'})
+                self.m_secrets['aws'] = dict(self.m_parameters['aws'])
 
             # Reading general parameters
             self.m_parameters['global'] = {}
@@ -228,23 +289,28 @@ class Configuration :
                     self.m_parameters['global'][key] = self.m_configuration['parameters'][key]
                     self.m_non_secrets['global'][key] = self.m_configuration['parameters'][key]
 
-            # Load the workflow keys
+            # Load the workflow keys, resolving each key once for both dictionaries
+            start = perf_counter()
+            counts = {'secret' : 0, 'value' : 0, 'file' : 0}
             if 'keys' in self.m_workflows :
                 for topic in self.m_workflows['keys'] :
                     if not topic in self.m_parameters : self.m_parameters[topic] = {}
                     if not topic in self.m_secrets : self.m_secrets[topic] = {}
                     if not topic in self.m_non_secrets : self.m_non_secrets[topic] = {}
                     for key in self.m_workflows['keys'][topic] :
-                        if self.m_workflows['keys'][topic][key]['type'] == 'secret' :
-                            self.m_parameters[topic][key] = self.read_secret(self.m_workflows['keys'][topic][key]['entry'])
-                            self.m_secrets[topic][key] = self.read_secret(self.m_workflows['keys'][topic][key]['entry'])
-                        elif self.m_workflows['keys'][topic][key]['type'] == 'value' :
-                            self.m_parameters[topic][key] = self.m_workflows['keys'][topic][key]['value']
-                            self.m_non_secrets[topic][key] = self.m_workflows['keys'][topic][key]['value']
-                        elif self.m_workflows['keys'][topic][key]['type'] == 'file' :
-                            self.m_parameters[topic][key] = self.read_file(self.m_configuration_path + '/' + self.m_workflows['keys'][topic][key]['name'])
-                            self.m_non_secrets[topic][key] = self.read_file(self.m_configuration_path + '/' + self.m_workflows['keys'][topic][key]['name'])
-                        else :  raise Exception('Unmanaged key type ' + self.m_workflows['keys'][topic][key]['type'] + ' for key ' + key)
+                        description = self.m_workflows['keys'][topic][key]
+                        if description['type'] == 'secret' :
+                            self.m_parameters[topic][key] = self.read_secret(description['entry'])
+                            self.m_secrets[topic][key] = self.m_parameters[topic][key]
+                        elif description['type'] == 'value' :
+                            self.m_parameters[topic][key] = description['value']
+                            self.m_non_secrets[topic][key] = self.m_parameters[topic][key]
+                        elif description['type'] == 'file' :
+                            self.m_parameters[topic][key] = self.read_file(self.m_configuration_path + '/' + description['name'])
+                            self.m_non_secrets[topic][key] = self.m_parameters[topic][key]
+                        else :  raise Exception('Unmanaged key type ' + description['type'] + ' for key ' + key)
+                        counts[description['type']] = counts[description['type']] + 1
+            log.info('Resolved %d secrets, %d values and %d files in %.3fs', counts['secret'], counts['value'], counts['file'], perf_counter() - start)
 
         except CredentialsError as exc :
             log.error('Credentials error : %s',str(exc))
@@ -267,6 +333,7 @@ class Configuration :
             if 'region'         not in self.m_parameters['global'] : raise Exception('Missing region in configuration file')
             if 'environment'    not in self.m_parameters['global'] : raise Exception('Missing environment in configuration file')
             if 'contact'        not in self.m_parameters['global'] : raise Exception('Missing contact in configuration file')
+            if 'backend'        in self.m_configuration and 'bucket' not in self.m_configuration['backend'] : raise Exception('Missing bucket in configuration file backend')
 
         except Exception as exc :
             log.error(str(exc))
@@ -286,8 +353,12 @@ class Configuration :
             for pth in self.m_configuration['paths'] :
                 self.m_paths[pth] = self.m_configuration_path + '/' + self.m_configuration['paths'][pth]
 
-            if 'states' in self.m_configuration['paths'] and not path.exists(self.m_configuration['paths']['states']) :
-                makedirs(self.m_configuration['paths']['states'])
+            if 'states' in self.m_paths and not path.exists(self.m_paths['states']) :
+                makedirs(self.m_paths['states'])
+
+        # Providers and terraform data are kept between runs in the cache directory
+        if not 'cache' in self.m_paths : self.m_paths['cache'] = self.m_configuration_path + '/.cache'
+        makedirs(self.m_paths['cache'], exist_ok=True)
 
         return result
 
@@ -310,6 +381,11 @@ class Configuration :
             if not 'keys'           in self.m_workflows : raise Exception('Missing keys in configuration file')
             if not 'subnets'        in self.m_workflows : raise Exception('Missing subnets in configuration file')
             if not 'deployment'     in self.m_workflows : raise Exception('Missing deployment workflow in configuration file')
+
+            # The destruction workflow may be derived from the deployment one
+            if self.m_configuration['workflows'].get('destruction') == 'reverse' :
+                self.m_workflows['destruction'] = Scheduler().reverse(self.m_workflows['deployment'])
+
             if not 'destruction'    in self.m_workflows : raise Exception('Missing destruction workflow in configuration file')
 
             for topic in self.m_workflows['subnets'] :
@@ -340,18 +416,33 @@ class Configuration :
             result = []
             for keepass_path in key :
                 if 'key' in keepass_path and 'feature' in keepass_path :
-                    data = self.m_keepass.find_entries_by_path(keepass_path['key'].split('/'))
-                    if data is None : raise Exception('Entry ' + keepass_path['key'] + ' not found in keepass')
-                    result.append(getattr(data,keepass_path['feature']))
+                    result.append(self.read_entry(keepass_path['key'], keepass_path['feature']))
                 else : raise Exception('Invalid key : ' + dumps(keepass_path))
         elif isinstance(key, dict) and 'key' in key and 'feature' in key:
-            data = self.m_keepass.find_entries_by_path(key['key'].split('/'))
-            if data is None : raise Exception('Entry ' + key['key'] + ' not found')
-            result = getattr(data, key['feature'])
+            result = self.read_entry(key['key'], key['feature'])
         else :   raise Exception('Unmanaged name format for key secret ' + key)
 
         return result
 
+    def read_entry(self, entry, feature) :
+        """ Read a feature of a keepass entry, from the vault agent or the database index
+        ---
+        entry   (str) : Path of the entry (groups and title separated by /)
+        feature (str) : Entry feature to retrieve (username, password, ...)
+        ---
+        returns       : The feature value
+        """
+
+        result = None
+
+        if self.m_agent is not None : result = self.m_agent.lookup(entry, feature)
+        else :
+            data = self.m_index.get(entry)
+            if data is None : raise Exception('Entry ' + entry + ' not found in keepass')
+            result = getattr(data, feature)
+
+        return result
+
 # pylint: disable=R0201
     def read_file(self, filename) :
         """ Read parameters in json files from either a file or a list of files
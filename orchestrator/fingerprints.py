@@ -0,0 +1,177 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to fingerprint terraform tasks inputs
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import path, listdir
+from subprocess import Popen, PIPE
+from hashlib import sha256
+from json import dumps
+from threading import Lock
+
+# Local includes
+from orchestrator.utils import load_and_parse_json_file, dump_json_file
+from orchestrator.utils import list_module_sources, parse_git_source, git_environment
+
+# Logging configuration
+log = getLogger('fingerprints')
+
+# pylint: disable=C0301, C0321
+class Fingerprints :
+    """ Class computing terraform tasks inputs fingerprints and storing the ones of the last successful runs """
+
+    m_filename  = None
+    m_values    = None
+    m_versions  = None
+    m_git       = None
+    m_lock      = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_filename = None
+        self.m_values   = {}
+        self.m_versions = {}
+        self.m_git      = []
+        self.m_lock     = Lock()
+
+    def configure(self, filename) :
+        """ Load the fingerprints of the previous runs
+        ---
+        filename (str) : File in which fingerprints are stored between runs
+        """
+
+        is_status_ok = True
+
+        try :
+            # Orchestrators sharing the fingerprints keep the values already loaded
+            with self.m_lock :
+                if filename != self.m_filename :
+                    self.m_filename = filename
+                    self.m_values = {}
+                    if path.isfile(filename) : self.m_values = load_and_parse_json_file(filename)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def configure_git(self, entries = None) :
+        """ Set the git configuration used to resolve the git modules versions
+        ---
+        entries  (list) : Git configuration keys and values, provided through the git processes environment only
+        """
+
+        is_status_ok = True
+
+        self.m_git = []
+        if entries is not None : self.m_git = list(entries)
+
+        return is_status_ok
+
+    def compute(self, directory, configuration, variables) :
+        """ Compute the fingerprint of a terraform task inputs
+        ---
+        directory     (str)  : Terraform working directory
+        configuration (str)  : Generated terraform configuration file (tfvars)
+        variables     (dict) : Secret variables provided through the command line
+        ---
+        Returns       (str)  : Hash of the terraform files of the directory and its local modules,
+                               of the configuration file, of the secrets and of the remote modules versions
+        """
+
+        digest = sha256()
+        sources = list_module_sources(directory)
+
+        for folder in [directory] + sources['local'] :
+            for filename in sorted(listdir(folder)) :
+                if filename.endswith('.tf') :
+                    digest.update((path.relpath(folder, directory) + '/' + filename).encode('UTF-8'))
+                    with open(folder + '/' + filename, 'rb') as fid : digest.update(fid.read())
+
+        with open(configuration, 'rb') as fid : digest.update(fid.read())
+        digest.update(sha256(dumps(variables, sort_keys=True).encode('UTF-8')).digest())
+
+        for source in sorted(sources['remote']) :
+            digest.update(source.encode('UTF-8'))
+            digest.update(self.version(source).encode('UTF-8'))
+
+        result = digest.hexdigest()
+
+        return result
+
+# pylint: disable=R1732
+    def version(self, source) :
+        """ Resolve the commit of a git module source, once per run
+        ---
+        source  (str) : Terraform module source
+        ---
+        Returns (str) : Commit referenced by the source, empty for other sources
+        """
+
+        result = ''
+        repository = parse_git_source(source)
+
+        if repository is not None :
+            with self.m_lock :
+                if repository in self.m_versions : result = self.m_versions[repository]
+            if repository not in self.m_versions :
+                reference = repository[1]
+                if reference is None : reference = 'HEAD'
+                process = Popen(['git', 'ls-remote', repository[0], reference, reference + '^{}'], stdout=PIPE, stderr=PIPE, env=git_environment(self.m_git))
+                (output, err) = process.communicate()
+                if process.returncode > 0 : raise Exception('Unable to resolve module ' + source + ' : ' + err.decode('UTF-8', 'replace'))
+                # Annotated tags are peeled last, so the commit is the last line
+                lines = output.decode('UTF-8').split()
+                if len(lines) > 0 : result = lines[-2]
+                else : result = reference
+                with self.m_lock : self.m_versions[repository] = result
+
+        return result
+# pylint: enable=R1732
+
+    def matches(self, state, value) :
+        """ Tests if a fingerprint matches the last successful run for a state
+        ---
+        state   (str)  : State file associated to the task
+        value   (str)  : Fingerprint of the task inputs
+        ---
+        Returns (bool) : True if the task inputs did not change
+        """
+
+        with self.m_lock :
+            result = (state in self.m_values and self.m_values[state] == value)
+
+        return result
+
+    def record(self, state, value) :
+        """ Store the fingerprint of a successful run
+        ---
+        state  (str) : State file associated to the task
+        value  (str) : Fingerprint of the task inputs
+        """
+
+        with self.m_lock :
+            self.m_values[state] = value
+            if self.m_filename is not None : dump_json_file(self.m_values, self.m_filename)
+
+    def forget(self, state) :
+        """ Remove the fingerprint of a state, for example when it is destroyed
+        ---
+        state  (str) : State file associated to the task
+        """
+
+        with self.m_lock :
+            if state in self.m_values :
+                self.m_values.pop(state)
+                if self.m_filename is not None : dump_json_file(self.m_values, self.m_filename)
+# pylint: enable=C0301, C0321
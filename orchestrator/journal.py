@@ -0,0 +1,96 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to journal the tasks completed by a workflow run
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import path, makedirs, replace
+from threading import Lock
+
+# Local includes
+from orchestrator.utils import load_and_parse_json_file, dump_json_file
+
+# Logging configuration
+log = getLogger('journal')
+
+# pylint: disable=C0301, C0321
+class Journal :
+    """ Class recording the tasks completed by a workflow run, with their inputs fingerprint and state version,
+    so that a failed run can be resumed without applying the completed tasks again """
+
+    m_filename  = None
+    m_entries   = None
+    m_lock      = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_filename = None
+        self.m_entries  = {}
+        self.m_lock     = Lock()
+
+    def configure(self, filename, resume = False) :
+        """ Start a run journal
+        ---
+        filename (str)  : File in which the journal is written after each completed task
+        resume   (bool) : True to keep the tasks completed by the previous run, False to start an empty journal
+        """
+
+        is_status_ok = True
+
+        try :
+            with self.m_lock :
+                self.m_filename = filename
+                self.m_entries = {}
+                makedirs(path.dirname(filename), exist_ok=True)
+                if resume and path.isfile(filename) : self.m_entries = load_and_parse_json_file(filename)
+                if resume : log.info('-------- Resuming run : %d tasks completed by the previous run', len(self.m_entries))
+                self.dump()
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def matches(self, identifier, fingerprint, serial) :
+        """ Tests if a task was completed with the same inputs and if its state did not change since
+        ---
+        identifier  (str)  : Task identifier in the workflow
+        fingerprint (str)  : Fingerprint of the task inputs
+        serial      (str)  : State lineage and serial of the task (empty for tasks without state)
+        ---
+        Returns     (bool) : True if the task does not need to be applied again
+        """
+
+        with self.m_lock :
+            result = (fingerprint is not None and identifier in self.m_entries and self.m_entries[identifier] == {'fingerprint' : fingerprint, 'serial' : serial})
+
+        return result
+
+    def record(self, identifier, fingerprint, serial) :
+        """ Record a completed task
+        ---
+        identifier  (str) : Task identifier in the workflow
+        fingerprint (str) : Fingerprint of the task inputs (None if not fingerprinted)
+        serial      (str) : State lineage and serial of the task once completed (empty for tasks without state)
+        """
+
+        with self.m_lock :
+            self.m_entries[identifier] = {'fingerprint' : fingerprint, 'serial' : serial}
+            self.dump()
+
+    def dump(self) :
+        """ Write the journal, replacing it at once so that an interrupted run never leaves a partial journal """
+
+        if self.m_filename is not None :
+            dump_json_file(self.m_entries, self.m_filename + '.tmp')
+            replace(self.m_filename + '.tmp', self.m_filename)
+# pylint: enable=C0301, C0321
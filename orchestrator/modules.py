@@ -0,0 +1,196 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to prefetch terraform git modules in a shared cache
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import path, makedirs, rename
+from subprocess import Popen, PIPE
+from hashlib import sha256
+from shutil import rmtree
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+# Local includes
+from orchestrator.utils import list_module_sources, parse_git_source, git_environment
+
+# Logging configuration
+log = getLogger('modules')
+
+# pylint: disable=C0301, C0321
+class Modules :
+    """ Class mirroring the git repositories of the terraform modules once per run in a local cache, so that
+    terraform initializations clone the modules from the local mirrors instead of the remote repositories """
+
+    m_cache     = None
+    m_git       = None
+    m_mirrors   = None
+    m_sources   = None
+    m_locks     = None
+    m_lock      = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_cache    = None
+        self.m_git      = []
+        self.m_mirrors  = {}
+        self.m_sources  = set()
+        self.m_locks    = {}
+        self.m_lock     = Lock()
+
+    def configure(self, cache, entries = None) :
+        """ Configure the modules cache
+        ---
+        cache    (str)  : Directory in which repositories mirrors are kept between runs
+        entries  (list) : Git configuration keys and values needed to reach the repositories, such as credentials
+        """
+
+        is_status_ok = True
+
+        try :
+            self.m_cache = path.abspath(cache)
+            makedirs(self.m_cache, mode=0o700, exist_ok=True)
+            self.m_git = []
+            if entries is not None : self.m_git = list(entries)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def prefetch(self, directories, max_parallel = 8) :
+        """ Mirror the git repositories of the modules used by terraform directories, each repository once
+        ---
+        directories  (list) : Terraform working directories
+        max_parallel (int)  : Maximum number of repositories fetched at the same time
+        """
+
+        is_status_ok = True
+        repositories = {}
+
+        try :
+
+            for directory in directories :
+                if path.isdir(directory) :
+                    for source in list_module_sources(directory)['remote'] :
+                        repository = parse_git_source(source)
+                        if repository is not None : repositories.setdefault(repository[0], set()).add(repository[1])
+
+            with self.m_lock : self.m_sources = self.m_sources | set(repositories.keys())
+
+            if len(repositories) > 0 :
+                log.info('-------- Prefetching %d module repositories', len(repositories))
+                with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(repositories)))) as executor :
+                    results = list(executor.map(self.fetch, repositories.keys(), repositories.values()))
+
+                # Modules which could not be mirrored are still retrieved by terraform from their repositories
+                for index, url in enumerate(repositories.keys()) :
+                    if not results[index] : log.warning('-------- Unable to mirror %s - Terraform will clone it', url)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def fetch(self, url, references) :
+        """ Create or update the mirror of a repository, unless it was already done in this run or
+        the mirror already holds all the references as tags or commits
+        ---
+        url        (str)  : Repository url
+        references (set)  : References used by the modules (None for the default branch)
+        ---
+        Returns    (bool) : True if the repository is mirrored
+        """
+
+        result = True
+
+        with self.m_lock :
+            lock = self.m_locks.setdefault(url, Lock())
+
+        with lock :
+
+            try :
+                with self.m_lock : shall_fetch = url not in self.m_mirrors
+
+                if shall_fetch :
+                    mirror = self.m_cache + '/' + sha256(url.encode('UTF-8')).hexdigest() + '.git'
+                    environment = git_environment(self.m_git)
+                    if not path.isdir(mirror) :
+                        log.info('-------- Mirroring module repository %s', url)
+                        if path.isdir(mirror + '.tmp') : rmtree(mirror + '.tmp')
+                        self.git(['git', 'clone', '--mirror', '--quiet', url, mirror + '.tmp'], environment)
+                        rename(mirror + '.tmp', mirror)
+                    elif not all(self.contains(mirror, reference) for reference in references) :
+                        log.info('-------- Updating module repository mirror %s', url)
+                        self.git(['git', '--git-dir', mirror, 'fetch', '--prune', '--quiet', 'origin'], environment)
+                    else : log.info('-------- Module repository mirror %s already up to date', url)
+                    with self.m_lock : self.m_mirrors[url] = mirror
+
+            except Exception as exc :
+                log.error(str(exc))
+                result = False
+
+        return result
+
+    def contains(self, mirror, reference) :
+        """ Tests if a mirror holds an immutable reference (tag or commit), which does not require any update
+        ---
+        mirror    (str)  : Mirror git directory
+        reference (str)  : Reference used by a module (None for the default branch)
+        ---
+        Returns   (bool) : True if the reference is a tag or a commit already in the mirror
+        """
+
+        result = False
+
+        if reference is not None :
+            candidates = ['refs/tags/' + reference + '^{commit}']
+            if len(reference) == 40 : candidates.append(reference + '^{commit}')
+            for candidate in candidates :
+                with Popen(['git', '--git-dir', mirror, 'rev-parse', '--verify', '--quiet', candidate], stdout=PIPE, stderr=PIPE) as process :
+                    process.communicate()
+                    if process.returncode == 0 : result = True
+
+        return result
+
+# pylint: disable=R1732
+    def git(self, cmd, environment) :
+        """ Run a git command, raising if it fails
+        ---
+        cmd         (list) : Git command and arguments
+        environment (dict) : Environment of the git process
+        """
+
+        process = Popen(cmd, stdout=PIPE, stderr=PIPE, env=environment)
+        (_, err) = process.communicate()
+        if process.returncode > 0 : raise Exception('Git command failed : ' + err.decode('UTF-8', 'replace'))
+# pylint: enable=R1732
+
+    def get_configuration(self) :
+        """ Build the git configuration entries redirecting the mirrored repositories to their local mirrors. Git rewrites
+        urls by prefix, so a repository is only redirected if all the other module repositories its url prefixes are mirrored
+        too, git then redirecting each of them to its own mirror as the longest match
+        ---
+        Returns (list) : Git configuration keys and values, to provide to the terraform processes through their environment
+        """
+
+        result = []
+
+        with self.m_lock :
+            for url, mirror in sorted(self.m_mirrors.items()) :
+                prefixed = [source for source in self.m_sources if source != url and source.startswith(url)]
+                if all(source in self.m_mirrors for source in prefixed) : result.append(('url.file://' + mirror + '.insteadOf', url))
+                else : log.warning('-------- Repository %s prefixes a repository that is not mirrored - Terraform will clone it', url)
+
+        return result
+# pylint: enable=C0301, C0321
@@ -12,7 +12,9 @@
 
 # System includes
 from logging import getLogger
+from os import path
 from json import dumps
+from hashlib import sha256
 
 # ip address manipulation
 from ipaddress import IPv4Network
@@ -21,7 +23,8 @@ from ipaddress import IPv4Network
 from boto3 import Session
 
 # Local includes
-from orchestrator.utils import load_and_parse_json_file
+from orchestrator.utils import load_and_parse_json_file, dump_json_file, load_state_outputs
+from orchestrator.allocator import Allocator
 
 # Logging configuration
 log = getLogger('networks')
@@ -32,7 +35,7 @@ class Networks :
 
     m_session = None
     m_client = None
-    m_subnets = {}
+    m_subnets = None
     m_shall_destroy = None
 
     def __init__(self) :
@@ -97,61 +100,48 @@ class Networks :
         return result
 
 
-    def compute(self, filename) :
+    def compute(self, filename, outputs = None) :
         """ Compute CIDR ranges for subnets described in the provided file
         ---
-        filename (str) : Filename describing subnets requirements
+        filename (str)  : Network state file, next to which the allocation is kept
+        outputs  (dict) : Outputs of the network state (read from the state file if None)
         """
 
         is_status_ok = True
 
         try :
-            if is_status_ok : state = load_and_parse_json_file(filename)
+            if is_status_ok and outputs is None : outputs = load_state_outputs(filename)
 
             # Check what to do depending on state and mode
-            if is_status_ok and len(state['outputs']) == 0 and self.m_shall_destroy :
+            if is_status_ok and len(outputs) == 0 and self.m_shall_destroy :
                 log.info('-------- Network structure already removed - Do nothing')
-            elif is_status_ok and 'vpc' not in state['outputs'] :
+            elif is_status_ok and 'vpc' not in outputs :
                 raise Exception('Network has not been created yet')
             else :
 
                 # Retrieve network configuration from state file
-                vpccidr = IPv4Network(state['outputs']['vpc']['value']['cidr'])
-                vpcid = state['outputs']['vpc']['value']['id']
-
-                # Retrieve all cidr in use in current vpc
-                response = self.m_client.describe_subnets(Filters=[{'Name': 'vpc-id','Values': [vpcid]}])
-                for topic in self.m_subnets :
-                    for variable in self.m_subnets[topic] :
-                        i_subnet = -1
-                        for subnet in self.m_subnets[topic][variable] :
-                            i_subnet = i_subnet + 1
-                            found = False
-
-                            # Checking if the subnet already exist
-                            for sub in response['Subnets'] :
-                                for tag in sub['Tags'] :
-                                    if tag['Key'] == 'DeployIdentifier' and tag['Value'] == subnet['name'] and subnet['mask'] == int(sub['CidrBlock'].split('/')[1]) :
-                                        self.m_subnets[topic][variable][i_subnet]['cidr'] = sub['CidrBlock']
-                                        log.debug('---- Already allocated to cidr %s',sub['CidrBlock'])
-                                        found = True
-
-                            # If not, look to book a valid range
-                            for candidate in list(vpccidr.subnets(new_prefix=subnet['mask'])) :
-                                if not found :
-                                    is_valid = True
-                                    # Check if range already exist in AWS
-                                    for sub in response['Subnets'] :
-                                        if candidate.overlaps(IPv4Network(sub['CidrBlock'])) : is_valid = False
-                                    # Check if range has not already been associated to another subnet
-                                    for top in self.m_subnets :
-                                        for var in self.m_subnets[top] :
-                                            for sub in self.m_subnets[top][var] :
-                                                if 'cidr' in sub and candidate.overlaps(IPv4Network(sub['cidr'])) : is_valid = False
-                                    if is_valid :
-                                        self.m_subnets[topic][variable][i_subnet]['cidr'] = str(candidate)
-                                        log.debug('---- Reserving cidr %s',str(candidate))
-                                        found = True
+                vpccidr = IPv4Network(outputs['vpc']['value']['cidr'])
+                vpcid = outputs['vpc']['value']['id']
+
+                # Reuse the previous allocation if neither the vpc nor the subnets changed
+                cache = None
+                cache_file = path.splitext(filename)[0] + '.subnets.json'
+                request = self.fingerprint()
+                if path.isfile(cache_file) : cache = load_and_parse_json_file(cache_file)
+                if cache is not None and cache['vpc'] == vpcid and cache['cidr'] == str(vpccidr) and cache['request'] == request :
+                    log.info('-------- Subnets unchanged since last allocation - Reusing cidr ranges')
+                    for topic in self.m_subnets :
+                        for variable in self.m_subnets[topic] :
+                            for i_subnet, subnet in enumerate(self.m_subnets[topic][variable]) :
+                                subnet['cidr'] = cache['subnets'][topic][variable][i_subnet]
+                else :
+                    self.allocate(vpcid, vpccidr)
+                    cache = {'vpc' : vpcid, 'cidr' : str(vpccidr), 'request' : request, 'subnets' : {}}
+                    for topic in self.m_subnets :
+                        cache['subnets'][topic] = {}
+                        for variable in self.m_subnets[topic] :
+                            cache['subnets'][topic][variable] = [subnet['cidr'] for subnet in self.m_subnets[topic][variable]]
+                    dump_json_file(cache, cache_file)
 
                 log.debug(dumps(self.m_subnets))
 
@@ -160,4 +150,55 @@ class Networks :
             is_status_ok = False
 
         return is_status_ok
+
+    def allocate(self, vpcid, vpccidr) :
+        """ Allocate CIDR ranges to subnets, keeping the ranges of the subnets already deployed
+        ---
+        vpcid   (str)         : Identifier of the vpc hosting the subnets
+        vpccidr (IPv4Network) : Cidr range of the vpc
+        """
+
+        # Retrieve all cidr in use in current vpc, indexed by deployment identifier and mask
+        existing = {}
+        allocator = Allocator(vpccidr)
+        paginator = self.m_client.get_paginator('describe_subnets')
+        for response in paginator.paginate(Filters=[{'Name': 'vpc-id','Values': [vpcid]}]) :
+            for sub in response['Subnets'] :
+                cidr = IPv4Network(sub['CidrBlock'])
+                allocator.reserve(cidr)
+                for tag in sub.get('Tags', []) :
+                    if tag['Key'] == 'DeployIdentifier' : existing[(tag['Value'], cidr.prefixlen)] = sub['CidrBlock']
+
+        # Checking if the subnet already exist
+        requests = []
+        for topic in self.m_subnets :
+            for variable in self.m_subnets[topic] :
+                for subnet in self.m_subnets[topic][variable] :
+                    if (subnet['name'], subnet['mask']) in existing :
+                        subnet['cidr'] = existing[(subnet['name'], subnet['mask'])]
+                        log.debug('---- Already allocated to cidr %s',subnet['cidr'])
+                    else : requests.append(subnet)
+
+        # If not, book a valid range, largest ranges first to limit fragmentation
+        for subnet in sorted(requests, key=lambda request : request['mask']) :
+            candidate = allocator.allocate(subnet['mask'])
+            if candidate is None : raise Exception('No cidr range available for subnet ' + subnet['name'] + ' with mask ' + str(subnet['mask']))
+            subnet['cidr'] = str(candidate)
+            log.debug('---- Reserving cidr %s',str(candidate))
+
+    def fingerprint(self) :
+        """ Hash the subnets requirements
+        ---
+        Returns (str) : Hash of the subnets description without their allocated ranges
+        """
+
+        request = {}
+        for topic in self.m_subnets :
+            request[topic] = {}
+            for variable in self.m_subnets[topic] :
+                request[topic][variable] = [{key : value for key, value in subnet.items() if key != 'cidr'} for subnet in self.m_subnets[topic][variable]]
+
+        result = sha256(dumps(request, sort_keys=True).encode('UTF-8')).hexdigest()
+
+        return result
 # pylint: enable=C0301, R0913, R1702, C0321, R0914
@@ -16,6 +16,11 @@ from logging import config, getLogger
 from os import path
 from sys import path as syspath
 from glob import glob
+from threading import Lock
+from time import perf_counter
+from hashlib import sha256
+from json import dumps
+from concurrent.futures import ThreadPoolExecutor
 
 # local includes
 from orchestrator.terraform import Terraform
@@ -24,9 +29,17 @@ from orchestrator.groups import Group
 from orchestrator.config import Configuration
 from orchestrator.networks import Networks
 from orchestrator.buckets import Buckets
+from orchestrator.scheduler import Scheduler
+from orchestrator.fingerprints import Fingerprints
+from orchestrator.modules import Modules
+from orchestrator.journal import Journal
+from orchestrator.states import States
+from orchestrator.timings import Timings
+from orchestrator.utils import dump_json_file, parse_state_serial
 
 syspath.append(path.normpath(path.join(path.dirname(__file__), './')))
 
+# pylint: disable=R0904, C0302
 class Orchestrator :
     """ Generic orchestrator class
     """
@@ -42,6 +55,23 @@ class Orchestrator :
     m_configuration             = None
     m_networks                  = None
     m_buckets                   = None
+    m_states                    = None
+    m_scheduler                 = None
+    m_started_steps             = None
+    m_lock                      = None
+    m_fingerprints              = None
+    m_modules                   = None
+    m_incremental               = False
+    m_resume                    = False
+    m_journaling                = False
+    m_journal                   = None
+    m_applied                   = None
+    m_plans                     = None
+    m_drift                     = None
+    m_timings                   = None
+    m_report_file               = None
+    m_prometheus_file           = None
+    m_readonly_methods          = ('define_networks',)
     m_shall_release_credentials = False
     m_shall_destroy             = False
     m_git_version               = 'unmanaged'
@@ -65,6 +95,22 @@ class Orchestrator :
         self.m_configuration                = Configuration()
         self.m_networks                     = Networks()
         self.m_buckets                      = Buckets()
+        self.m_states                       = States()
+        self.m_scheduler                    = Scheduler()
+        self.m_started_steps                = set()
+        self.m_lock                         = Lock()
+        self.m_fingerprints                 = Fingerprints()
+        self.m_modules                      = Modules()
+        self.m_incremental                  = False
+        self.m_resume                       = False
+        self.m_journaling                   = False
+        self.m_journal                      = Journal()
+        self.m_applied                      = set()
+        self.m_plans                        = None
+        self.m_drift                        = None
+        self.m_timings                      = Timings()
+        self.m_report_file                  = None
+        self.m_prometheus_file              = None
 
 # pylint: disable=R0201
     def configure_logging(self, filename) :
@@ -86,6 +132,86 @@ class Orchestrator :
         return is_status_ok
 # pylint: enable=R0201
 
+# pylint: disable=C0301, C0321
+    def configure_reporting(self, report = None, prometheus = None) :
+        """ Configure the timings reports written at the end of the workflow
+        ----------
+        report        (str)  : Json file receiving the steps, tasks and terraform phases durations (None for no report)
+        prometheus    (str)  : Prometheus node exporter textfile receiving the same durations (None for no textfile)
+        """
+
+        is_status_ok = True
+
+        self.m_report_file      = report
+        self.m_prometheus_file  = prometheus
+
+        return is_status_ok
+
+    def configure_tfvars(self, tfvars_format = 'hcl') :
+        """ Select the format of the terraform configuration files generated for the tasks
+        ----------
+        tfvars_format (str)  : hcl (conf.tfvars) or json (conf.tfvars.json, read natively by terraform without hcl rendering)
+        """
+
+        is_status_ok = self.m_terraform.configure_tfvars(tfvars_format)
+
+        return is_status_ok
+
+    def configure_timeouts(self, timeouts = None, grace = 30) :
+        """ Limit the duration of the terraform commands run by the tasks
+        ----------
+        timeouts      (dict) : Maximum duration in seconds of each terraform phase (init, plan, apply, destroy), others are not limited
+        grace         (int)  : Duration left to terraform to stop cleanly after each interruption signal, in seconds
+        """
+
+        is_status_ok = self.m_terraform.configure_timeouts(timeouts, grace)
+
+        return is_status_ok
+
+    def configure_plans(self, mode = None) :
+        """ Select how terraform plans are kept between runs
+        ----------
+        mode          (str)  : None to plan and apply each task, save to only plan the terraform tasks and save their plans,
+                               reuse to apply the saved plans which task inputs and state did not change since they were saved
+        """
+
+        is_status_ok = True
+
+        try :
+            if mode not in (None, 'save', 'reuse') : raise Exception('Unmanaged plans mode ' + str(mode))
+            self.m_plans = mode
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def configure_journal(self, journaling = True) :
+        """ Select if the terraform tasks inputs are fingerprinted in the run journal, so that a failed run can be
+        resumed. Fingerprinting costs a remote lookup per git module, so that runs only record the state version of
+        their completed tasks by default, and resumed runs always fingerprint their tasks
+        ----------
+        journaling    (bool) : True to fingerprint the terraform tasks inputs in the run journal
+        """
+
+        is_status_ok = True
+
+        self.m_journaling = journaling
+
+        return is_status_ok
+
+    def write_timings(self) :
+        """ Write the configured timings reports """
+
+        is_status_ok = True
+
+        if self.m_report_file is not None and not self.m_timings.write_report(self.m_report_file) : is_status_ok = False
+        if self.m_prometheus_file is not None and not self.m_timings.write_prometheus(self.m_prometheus_file) : is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0301, C0321
+
 # pylint: disable=C0321
     def configure(self, filename, env, shall_destroy = False) :
         """ Configure deployment from configuration file
@@ -123,28 +249,68 @@ class Orchestrator :
         """
 
         is_status_ok = True
-        username = ''
-        password = ''
-        region = ''
+
+        try :
+            if is_status_ok : is_status_ok = self.initialize_parameters(aws_username)
+            if is_status_ok : is_status_ok = self.initialize_steps()
+            if is_status_ok : is_status_ok = self.prefetch_modules()
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def initialize_parameters(self, aws_username = None) :
+        """ Retrieve parameters and set the credentials shared by all the workflow tasks
+        ---
+        aws_username (str) : Identifier of the vault entry in which AWS credentials to use for
+                             deployment are set (under aws-<username>-access-key entry)
+        """
+
+        is_status_ok = True
 
         try :
             if is_status_ok : self.m_log.debug('------- Retrieving all parameters from sources')
             if is_status_ok : is_status_ok = self.m_configuration.set_parameters(aws_username)
             if is_status_ok : is_status_ok = self.m_configuration.check()
 
-            if is_status_ok : self.m_log.debug('------- Setting gitlab credentials for terraform modules')
+            if is_status_ok : self.m_log.debug('------- Retrieving gitlab credentials for terraform modules')
             if is_status_ok : is_status_ok = self.m_gitlab.configure( \
                 self.m_configuration.get_parameter('git'))
-            if is_status_ok : is_status_ok = self.m_gitlab.set_credentials()
-            if is_status_ok : self.m_log.debug('------- Successfully set gitlab credentials')
 
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0321, C0301, R0912
+
+# pylint: disable=C0321, C0301, R0912
+    def initialize_steps(self) :
+        """ Prepare the generic steps once parameters are retrieved """
+
+        is_status_ok = True
+        username = ''
+        password = ''
+        region = ''
+
+        try :
             if is_status_ok : self.m_log.debug('------- Initializing generic steps')
             if is_status_ok : username = self.m_configuration.get_parameter('aws')['username']
             if is_status_ok : password = self.m_configuration.get_parameter('aws')['password']
             if is_status_ok : region = self.m_configuration.get_parameter('global')['region']
+            if is_status_ok : is_status_ok = self.configure_backend(self.m_configuration.get_backend(), region)
             if is_status_ok : is_status_ok = self.m_networks.configure(username, password, region, self.m_shall_destroy, self.m_configuration.get_subnets())
             if is_status_ok : is_status_ok = self.m_buckets.configure(username, password, region)
-            if is_status_ok : is_status_ok = self.m_terraform.configure(username, password, region)
+            if is_status_ok : is_status_ok = self.m_states.configure(self.m_buckets, self.m_configuration.get_path('cache') + '/states')
+            if is_status_ok : is_status_ok = self.m_terraform.configure(username, password, region, self.m_configuration.get_path('cache'), self.m_timings)
+            if is_status_ok : is_status_ok = self.m_terraform.configure_workspaces(self.m_configuration.get_path('terraform'))
+            if is_status_ok : is_status_ok = self.m_fingerprints.configure(self.m_configuration.get_path('cache') + '/fingerprints.json')
+            # Credentials are only provided to the git and terraform processes, through their environment
+            if is_status_ok : is_status_ok = self.m_terraform.configure_git(self.m_gitlab.get_configuration())
+            if is_status_ok : is_status_ok = self.m_fingerprints.configure_git(self.m_gitlab.get_configuration())
+            if is_status_ok : is_status_ok = self.m_modules.configure(self.m_configuration.get_path('cache') + '/modules', self.m_gitlab.get_configuration())
 
         except Exception as exc :
             self.m_log.error(str(exc))
@@ -154,6 +320,55 @@ class Orchestrator :
 # pylint: enable=C0321, C0301, R0912
 
 # pylint: disable=C0321, C0301
+    def configure_backend(self, backend, region) :
+        """ Set the s3 backend used by the terraform tasks with an s3 backend feature
+        ---
+        backend    (dict) : Backend bucket, path in the bucket and region (None if no task uses an s3 backend)
+        region     (str)  : Deployment region, used when the backend sets no region
+        """
+
+        is_status_ok = True
+
+        try :
+            self.m_s3_backend_bucket = None
+            self.m_s3_backend_path = None
+            self.m_s3_backend_region = None
+            if backend is not None :
+                if 'bucket' not in backend : raise Exception('Missing bucket in s3 backend configuration')
+                self.m_s3_backend_bucket = backend['bucket']
+                self.m_s3_backend_path = backend.get('path', '')
+                if self.m_s3_backend_path != '' and not self.m_s3_backend_path.endswith('/') : self.m_s3_backend_path = self.m_s3_backend_path + '/'
+                self.m_s3_backend_region = backend.get('region', region)
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def prefetch_modules(self) :
+        """ Mirror the git repositories of the workflow terraform modules, and make terraform clone the modules from the mirrors """
+
+        is_status_ok = True
+        directories = []
+
+        try :
+            for step in self.m_workflow.values() :
+                for task in step['tasks'] :
+                    if task['type'] == 'terraform' :
+                        directory = self.m_configuration.get_path('terraform') + '/' + task['path']
+                        if directory not in directories : directories.append(directory)
+
+            if is_status_ok : self.m_log.debug('------- Prefetching terraform modules')
+            if is_status_ok : is_status_ok = self.m_modules.prefetch(directories)
+            if is_status_ok : is_status_ok = self.m_terraform.configure_git(self.m_gitlab.get_configuration() + self.m_modules.get_configuration())
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
     def empty_buckets(self, step, state) :
         """ Empty all the s3 buckets mentioned in the terraform state file under the "bucket" output
         ---
@@ -163,9 +378,8 @@ class Orchestrator :
         is_status_ok = True
 
         try :
-            if is_status_ok : env = self.m_configuration.get_parameter('global')['environment']
-            if is_status_ok : filename = self.m_configuration.get_path('states') + '/' + state + '.' + env + '.tfstate'
-            if is_status_ok : is_status_ok = self.m_buckets.empty_buckets(filename, self.m_configuration.get_parameter('global')['account'], self.m_configuration.get_parameter(step)['service_principal'])
+            if is_status_ok : outputs = self.state_outputs(state)
+            if is_status_ok : is_status_ok = self.m_buckets.empty_buckets(outputs, self.m_configuration.get_parameter('global')['account'], self.m_configuration.get_parameter(step)['service_principal'])
 
         except Exception as exc :
             self.m_log.error(str(exc))
@@ -183,17 +397,15 @@ class Orchestrator :
         """
 
         is_status_ok = True
+        backend = 'local'
 
         try :
             # Retrieve s3 backend configuration from state file
 
-            if is_status_ok : env = self.m_configuration.get_parameter('global')['environment']
-            if is_status_ok : backend_file = self.m_configuration.get_path('states') + '/' + state + '.' + env + '.tfstate'
-            if is_status_ok and path.isfile(backend_file) :
-                if is_status_ok : files = glob(self.m_configuration.get_path('states') + '/*.tfstate')
-                if is_status_ok : is_status_ok = self.m_buckets.upload_states(files, backend_file)
-                if is_status_ok : files = glob(self.m_configuration.get_path('states') + '/*.json')
-                if is_status_ok : is_status_ok = self.m_buckets.upload_states(files, backend_file)
+            if is_status_ok : backend = self.state_backend(state)
+            if is_status_ok and (backend != 'local' or path.isfile(self.state_location(state, backend))) :
+                if is_status_ok : files = glob(self.m_configuration.get_path('states') + '/*.tfstate') + glob(self.m_configuration.get_path('states') + '/*.json')
+                if is_status_ok : is_status_ok = self.m_buckets.upload_states(files, self.state_outputs(state), self.m_configuration.get_path('cache') + '/uploads.json')
 
         except Exception as exc :
             self.m_log.error(str(exc))
@@ -212,9 +424,10 @@ class Orchestrator :
         is_status_ok = True
 
         try :
-            if is_status_ok : env = self.m_configuration.get_parameter('global')['environment']
-            if is_status_ok : state_file = self.m_configuration.get_path('states') + '/' + self.m_workflow['network']['tasks'][0]['state'] + '.' + env + '.tfstate'
-            if is_status_ok : is_status_ok = self.m_networks.compute(state_file)
+            if is_status_ok : state = self.m_workflow['network']['tasks'][0]['state']
+            # The allocation is kept in the states folder, whatever the network state backend
+            if is_status_ok : state_file = self.state_location(state, 'local')
+            if is_status_ok : is_status_ok = self.m_networks.compute(state_file, self.state_outputs(state))
 
         except Exception as exc :
             self.m_log.error(str(exc))
@@ -223,65 +436,250 @@ class Orchestrator :
         return is_status_ok
 # pylint: enable=C0321, W0613, C0301
 
-# pylint: disable=R0912, C0321, C0301
-    def terraform(self, step_path, state, topic, backend='local') :
+# pylint: disable=C0321, C0301
+    def terraform(self, step_path, state, topic, backend='local', identifier = None) :
         """ Apply a terraform task
         ---
         step_path  (str) : Path in which terraform files are located
         state      (str) : Name of the state file to create from deployment
         topic      (str) : Name of the module associated to the task (to be provided to terraform)
         backend    (str) : Backend type to use for the task (local or s3)
+        identifier (str) : Identifier of the task in the workflow, to record it in the run journal (None for no journal)
         """
 
         is_status_ok = True
 
         try :
-            # Create terraform configuration file
-            keys = {}
-            secrets = {}
-
-            # Add common keys
-            if is_status_ok : keys['environment'] = self.m_configuration.get_parameter('global')['environment']
-            if is_status_ok : keys['contact_email'] = self.m_configuration.get_parameter('global')['contact']
-            if is_status_ok : keys['topic'] = self.m_configuration.get_parameter('global')['topic']
-            if is_status_ok : keys['git_version'] = self.m_git_version
-            if is_status_ok : keys['module'] = topic
-
-            # Add specific keys from configuration
-            if is_status_ok and self.m_configuration.exists_in_parameters(topic) : secrets = self.m_configuration.get_secrets(topic)
-
-            if is_status_ok and self.m_configuration.exists_in_parameters(topic) : keys.update(self.m_configuration.get_non_secrets(topic))
-            if is_status_ok and self.m_networks.exists(topic) : keys.update(self.m_networks.get(topic))
-
-            if is_status_ok : output_file = self.m_configuration.get_path('terraform') + '/' + step_path + '/conf.tfvars'
-            if is_status_ok : step_dir = self.m_configuration.get_path('terraform') + '/' + step_path
-            if is_status_ok : is_status_ok = self.m_terraform.create_configuration_file(output_file, keys)
-
-            # Use terraform
-            if is_status_ok and backend == 'local' :
-                state_file = self.m_configuration.get_path('states') + '/' + state + '.' + keys['environment'] + '.tfstate'
-            elif is_status_ok and backend == 's3' :
-                state_file = self.m_s3_backend_path + state + '.' + keys['environment'] + '.tfstate'
-            elif is_status_ok : raise Exception('Unmanaged backend type {backend}')
-
-            if not self.m_shall_destroy and is_status_ok :
-                is_status_ok = self.m_terraform.apply(step_dir, state_file, self.m_s3_backend_bucket, self.m_s3_backend_region, output_file, variables = secrets, backend = backend)
-            elif is_status_ok :
-                is_status_ok = self.m_terraform.destroy(step_dir, state_file, self.m_s3_backend_bucket, self.m_s3_backend_region, output_file, variables = secrets, backend = backend)
+            task = self.prepare_terraform(step_path, state, topic, backend)
+
+            fingerprint = None
+            if (self.m_incremental or self.m_plans is not None) and not self.m_shall_destroy :
+                fingerprint = self.m_fingerprints.compute(task['directory'], task['configuration'], task['variables'])
+
+            # Tasks are journaled once completed, which saving a plan is not. Their inputs are only fingerprinted when the
+            # journal may be used to resume a run, and destructions only depend on the state version
+            journaled = (identifier is not None and self.m_plans != 'save')
+            journal = None
+            if journaled and self.m_shall_destroy : journal = ''
+            elif journaled and (self.m_resume or self.m_journaling) : journal = self.journal_fingerprint(task, fingerprint)
+
+            shall_apply = self.shall_apply(task, identifier, fingerprint, journal, backend)
+
+            # Saved plans are only valid for the same inputs and the same state version
+            plan_key = None
+            if is_status_ok and self.m_plans is not None and not self.m_shall_destroy and shall_apply :
+                plan_key = sha256((fingerprint + '|' + self.state_serial(task['state'], backend)).encode('UTF-8')).hexdigest()
+
+            if not self.m_shall_destroy and is_status_ok and shall_apply and self.m_plans == 'save' :
+                is_status_ok = self.m_terraform.save_plan(task['directory'], task['state'], self.m_s3_backend_bucket, self.m_s3_backend_region, task['configuration'], plan_key, variables = task['variables'], backend = backend)
+            elif not self.m_shall_destroy and is_status_ok and shall_apply :
+                is_status_ok = self.m_terraform.apply(task['directory'], task['state'], self.m_s3_backend_bucket, self.m_s3_backend_region, task['configuration'], variables = task['variables'], backend = backend, plan_key = plan_key)
+                if is_status_ok and self.m_incremental : self.m_fingerprints.record(task['state'], fingerprint)
+                self.m_states.forget(task['state'], backend, self.m_s3_backend_bucket)
+            elif is_status_ok and self.m_shall_destroy and shall_apply :
+                is_status_ok = self.m_terraform.destroy(task['directory'], task['state'], self.m_s3_backend_bucket, self.m_s3_backend_region, task['configuration'], variables = task['variables'], backend = backend)
+                if is_status_ok : self.m_fingerprints.forget(task['state'])
+                self.m_states.forget(task['state'], backend, self.m_s3_backend_bucket)
+
+            if is_status_ok and journaled : self.journal_task(identifier, journal, task['state'], backend)
 
         except Exception as exc :
             self.m_log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
-# pylint: enable=R0912, C0321, C0301
+# pylint: enable=C0321, C0301
+
+# pylint: disable=C0321, C0301, R0913, R0917
+    def shall_apply(self, task, identifier, fingerprint, journal, backend='local') :
+        """ Decide if a terraform task shall be applied, or skipped because it was completed by the previous run
+        (when resuming) or because its inputs did not change since its last successful run (in incremental mode)
+        ---
+        task        (dict) : Task prepared by prepare_terraform
+        identifier  (str)  : Identifier of the task in the workflow (None if the task is not journaled)
+        fingerprint (str)  : Fingerprint of the task inputs for incremental mode (None if not computed)
+        journal     (str)  : Fingerprint of the task inputs for the run journal (None if the task inputs are not fingerprinted)
+        backend     (str)  : Backend type to use for the task (local or s3)
+        ---
+        Returns     (bool) : True if the task shall be applied
+        """
+
+        result = True
+
+        if identifier is not None and self.m_plans != 'save' :
+            serial = None
+            if self.m_resume and journal is not None :
+                try : serial = self.state_serial(task['state'], backend)
+                except Exception as exc : self.m_log.warning('-------- Unable to read state version for the run journal : %s', str(exc))
+            if serial is None : journal = None
+            if self.skip_completed(identifier, journal, serial) :
+                self.m_log.info('-------- Task completed by the previous run with the same inputs - Skipping task')
+                result = False
+
+        if result and self.m_incremental and not self.m_shall_destroy :
+            result = not (self.m_fingerprints.matches(task['state'], fingerprint) and (backend != 'local' or path.isfile(task['state'])))
+            if not result : self.m_log.info('-------- Inputs unchanged since last deployment of %s - Skipping task', task['state'])
+
+        return result
+# pylint: enable=C0321, C0301, R0913, R0917
 
 # pylint: disable=C0321, C0301
-    def apply_task(self, task, step) :
+    def journal_fingerprint(self, task, fingerprint = None) :
+        """ Fingerprint the inputs of a terraform task for the run journal. Journaling is only bookkeeping,
+        so a task which inputs can not be fingerprinted is applied without being journaled
+        ---
+        task        (dict) : Task prepared by prepare_terraform
+        fingerprint (str)  : Fingerprint already computed for the task (None if not computed yet)
+        ---
+        Returns     (str)  : Fingerprint of the task inputs, None if it could not be computed
+        """
+
+        result = fingerprint
+
+        try :
+            if result is None : result = self.m_fingerprints.compute(task['directory'], task['configuration'], task['variables'])
+
+        except Exception as exc :
+            self.m_log.warning('-------- Unable to fingerprint task for the run journal : %s', str(exc))
+            result = None
+
+        return result
+
+    def journal_task(self, identifier, fingerprint, state = None, backend = 'local') :
+        """ Record a completed task in the run journal, without failing the task if the journal can not be written
+        ---
+        identifier  (str) : Identifier of the task in the workflow
+        fingerprint (str) : Fingerprint of the task inputs (None if not fingerprinted, the task is then never skipped)
+        state       (str) : State of the task (None for tasks without state)
+        backend     (str) : Backend type used by the task (local or s3)
+        """
+
+        try :
+            serial = ''
+            if state is not None : serial = self.state_serial(state, backend)
+            self.m_journal.record(identifier, fingerprint, serial)
+
+        except Exception as exc :
+            self.m_log.warning('-------- Unable to record task in the run journal : %s', str(exc))
+
+    def state_serial(self, state, backend='local') :
+        """ Read the version of a task state from its first bytes
+        ---
+        state      (str) : State file (filename for local backend, s3 object name with path for s3 backend)
+        backend    (str) : Backend type to use for the task (local or s3)
+        ---
+        Returns    (str) : State lineage and serial, empty if the state does not exist yet
+        """
+
+        header = None
+
+        if backend == 'local' and path.isfile(state) :
+            with open(state, 'rb') as fid : header = fid.read(4096)
+        elif backend == 's3' : header = self.m_buckets.read_object_head(self.m_s3_backend_bucket, state, self.m_s3_backend_region)
+
+        result = parse_state_serial(header)
+
+        return result
+
+    def state_location(self, state, backend='local') :
+        """ Build the location of a task state
+        ---
+        state      (str) : Name of the state file created by the task
+        backend    (str) : Backend type used by the task (local or s3)
+        ---
+        Returns    (str) : Filename for local backend, s3 object name with path for s3 backend
+        """
+
+        env = self.m_configuration.get_parameter('global')['environment']
+
+        if backend == 'local'   : result = self.m_configuration.get_path('states') + '/' + state + '.' + env + '.tfstate'
+        elif backend == 's3' and self.m_s3_backend_bucket is None : raise Exception('State ' + state + ' uses the s3 backend, but no backend (bucket, path, region) is set in configuration file')
+        elif backend == 's3'    : result = self.m_s3_backend_path + state + '.' + env + '.tfstate'
+        else                    : raise Exception('Unmanaged backend type ' + backend)
+
+        return result
+
+    def state_backend(self, state) :
+        """ Find the backend of a state from the terraform tasks creating it
+        ---
+        state      (str) : Name of the state file created by the task
+        ---
+        Returns    (str) : Backend feature of the first terraform task of the workflows using the state, local by default
+        """
+
+        result = 'local'
+
+        workflows = [self.m_workflow, self.m_configuration.get_workflow('deployment')]
+        tasks = [task for workflow in workflows if workflow is not None for step in workflow.values() for task in step['tasks']]
+        for task in reversed(tasks) :
+            if task['type'] == 'terraform' and task['state'] == state : result = task.get('backend', 'local')
+
+        return result
+
+    def state_outputs(self, state) :
+        """ Read the outputs of a task state, from the states folder or from the s3 backend
+        ---
+        state      (str)  : Name of the state file created by the task
+        ---
+        Returns    (dict) : Content of the state outputs
+        """
+
+        backend = self.state_backend(state)
+        result = self.m_states.get_outputs(self.state_location(state, backend), backend, self.m_s3_backend_bucket, self.m_s3_backend_region)
+
+        return result
+
+    def prepare_terraform(self, step_path, state, topic, backend='local') :
+        """ Resolve the inputs of a terraform task and write its configuration file
+        ---
+        step_path  (str)  : Path in which terraform files are located
+        state      (str)  : Name of the state file to create from deployment
+        topic      (str)  : Name of the module associated to the task (to be provided to terraform)
+        backend    (str)  : Backend type to use for the task (local or s3)
+        ---
+        Returns    (dict) : Task working directory (directory), state file (state), configuration file (configuration)
+                            and secrets to provide through the command line (variables)
+        """
+
+        result = {}
+
+        # Create terraform configuration file
+        keys = {}
+        secrets = {}
+
+        # Add common keys
+        keys['environment'] = self.m_configuration.get_parameter('global')['environment']
+        keys['contact_email'] = self.m_configuration.get_parameter('global')['contact']
+        keys['topic'] = self.m_configuration.get_parameter('global')['topic']
+        keys['git_version'] = self.m_git_version
+        keys['module'] = topic
+
+        # Add specific keys from configuration
+        if self.m_configuration.exists_in_parameters(topic) : secrets = self.m_configuration.get_secrets(topic)
+
+        if self.m_configuration.exists_in_parameters(topic) : keys.update(self.m_configuration.get_non_secrets(topic))
+        if self.m_networks.exists(topic) : keys.update(self.m_networks.get(topic))
+
+        result['directory'] = self.m_configuration.get_path('terraform') + '/' + step_path
+        result['variables'] = secrets
+
+        # Use terraform
+        result['state'] = self.state_location(state, backend)
+
+        # The configuration file is specific to the task state, so that environments sharing the working directory do not clobber it
+        result['configuration'] = self.m_terraform.configuration_file(result['directory'], result['state'], backend)
+        if not self.m_terraform.create_configuration_file(result['configuration'], keys) : raise Exception('Unable to write configuration file ' + result['configuration'])
+
+        return result
+# pylint: enable=C0321, C0301
+
+# pylint: disable=C0321, C0301, R0912
+    def apply_task(self, task, step, identifier = None) :
         """ Apply a task in workflow
         ---
         task       (str) : Name of the task to perform
         step       (str) : Name of the step to which the task belong
+        identifier (str) : Identifier of the task in the workflow, to record it in the run journal (None for no journal)
         """
 
         is_status_ok = True
@@ -290,34 +688,77 @@ class Orchestrator :
             configuration_key = step
             if 'key' in task : configuration_key = task['key']
 
-            if task['type'] == 'terraform' :
-                if is_status_ok : is_status_ok = self.terraform(task['path'], task['state'], configuration_key)
-            elif task['type'] == 'python' :
-                func = getattr(self,task['method'])
-                if is_status_ok : is_status_ok = func(step, **task['args'])
-            else : raise Exception('Unmanaged task type ' + task['type'])
+            labels = {'environment' : self.m_configuration.get_parameter('global')['environment'], 'step' : step, 'task' : task['description'], 'type' : task['type']}
+            if task['type'] == 'python' : labels['method'] = task['method']
+
+            with self.m_timings.measure('task', **labels) as record :
+                # When only saving plans, python tasks modifying the infrastructure are skipped
+                if task['type'] == 'python' and self.m_plans == 'save' and task['method'] not in self.m_readonly_methods :
+                    self.m_log.info('-------- Saving plans only - Skipping python task %s', task['method'])
+                elif task['type'] == 'terraform' :
+                    if is_status_ok : is_status_ok = self.terraform(task['path'], task['state'], configuration_key, task.get('backend', 'local'), identifier)
+                elif task['type'] == 'python' :
+                    func = getattr(self,task['method'])
+                    # Read-only python tasks provide inputs to the next tasks, they are applied again when resuming
+                    fingerprint = None
+                    if identifier is not None and task['method'] not in self.m_readonly_methods :
+                        fingerprint = sha256(dumps({'step' : step, 'method' : task['method'], 'args' : task['args']}, sort_keys=True, default=str).encode('UTF-8')).hexdigest()
+                    if fingerprint is not None and self.skip_completed(identifier, fingerprint, '') :
+                        self.m_log.info('-------- Task completed by the previous run with the same inputs - Skipping task')
+                    else :
+                        if is_status_ok : is_status_ok = func(step, **task['args'])
+                        if is_status_ok and fingerprint is not None : self.journal_task(identifier, fingerprint)
+                else : raise Exception('Unmanaged task type ' + task['type'])
+                record['success'] = is_status_ok
 
         except Exception as exc :
             self.m_log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
+# pylint: enable=C0321, C0301, R0912
+
+# pylint: disable=C0321, C0301
+    def skip_completed(self, identifier, fingerprint, serial) :
+        """ Tests if a task completed by the previous run can be skipped when resuming. Tasks that are applied are
+        remembered, so that the tasks depending on them are applied again too
+        ---
+        identifier  (str)  : Identifier of the task in the workflow
+        fingerprint (str)  : Fingerprint of the task inputs (None if it could not be computed, the task is then applied)
+        serial      (str)  : Current lineage and serial of the task state (empty for tasks without state)
+        ---
+        Returns     (bool) : True if the task shall be skipped
+        """
+
+        result = False
+
+        with self.m_lock :
+            if self.m_resume and fingerprint is not None and self.m_journal.matches(identifier, fingerprint, serial) :
+                result = (len(self.m_applied & self.m_scheduler.get_dependencies(identifier)) == 0)
+            if not result : self.m_applied.add(identifier)
+
+        return result
 # pylint: enable=C0321, C0301
 
-# pylint: disable=R1702, R0912, C0321, C0301
-    def workflow(self, database, key, steps, username = None) :
+# pylint: disable=C0321, C0301, R0913, R0917
+    def workflow(self, database, key, steps, username = None, max_parallel = 1, incremental = False, resume = False) :
         """ Apply the workflow specified in the configuration file
         ---
-        database   (str) : Path to the keepass database in which secrets are stored
-        key        (str) : Vault key file or name of the environment variable in which vault key is stored
-        steps      (str) : List of the steps to apply (empty if all steps shall be applied)
-        username   (str) : Identifier of the vault entry in which AWS credentials to use for deployment are set (under aws-<username>-access-key entry)
+        database     (str)  : Path to the keepass database in which secrets are stored
+        key          (str)  : Vault key file or name of the environment variable in which vault key is stored
+        steps        (str)  : List of the steps to apply (empty if all steps shall be applied)
+        username     (str)  : Identifier of the vault entry in which AWS credentials to use for deployment are set (under aws-<username>-access-key entry)
+        max_parallel (int)  : Maximum number of independent tasks to apply at the same time
+        incremental  (bool) : True if terraform tasks which inputs did not change since their last successful deployment shall be skipped
+        resume       (bool) : True if the tasks completed by the previous run with the same inputs shall be skipped
         """
 
         is_status_ok = True
 
         try :
 
+            self.m_incremental = incremental
+
             i_step = 2
             if is_status_ok : self.m_log.info('-- %d   - Extracting secrets from database %s', i_step, database) ; i_step = i_step + 1
             if is_status_ok : is_status_ok = self.m_configuration.load_secrets(database, key)
@@ -325,32 +766,294 @@ class Orchestrator :
             if is_status_ok : self.m_log.info('-- %d   - Initializing deployment workflow', i_step) ; i_step = i_step + 1
             if is_status_ok : is_status_ok = self.initialize(username)
 
-            for step in self.m_workflow :
+            if is_status_ok : is_status_ok = self.execute(steps, max_parallel, incremental, i_step, resume)
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        self.write_timings()
+
+        return is_status_ok
+# pylint: enable=C0321, C0301, R0913, R0917
+
+# pylint: disable=C0321, C0301, R0913, R0917
+    def execute(self, steps, max_parallel = 1, incremental = False, first_step = 1, resume = False) :
+        """ Apply the workflow steps, once the workflow is initialized
+        ---
+        steps        (str)  : List of the steps to apply (empty if all steps shall be applied)
+        max_parallel (int)  : Maximum number of independent tasks to apply at the same time
+        incremental  (bool) : True if terraform tasks which inputs did not change since their last successful deployment shall be skipped
+        first_step   (int)  : Number of the first step in logs
+        resume       (bool) : True if the tasks completed by the previous run with the same inputs shall be skipped
+        """
+
+        is_status_ok = True
+
+        try :
+
+            self.m_incremental = incremental
+            self.m_resume = resume
+
+            workflow = 'deployment'
+            if self.m_shall_destroy : workflow = 'destruction'
+
+            if is_status_ok : self.m_scheduler = Scheduler()
+            if is_status_ok : self.m_started_steps = set()
+            if is_status_ok : self.m_applied = set()
+            if is_status_ok : is_status_ok = self.m_scheduler.build(self.m_workflow, steps, first_step)
+            if is_status_ok : is_status_ok = self.m_journal.configure(self.m_configuration.get_path('cache') + '/journals/' + self.m_configuration.get_parameter('global')['environment'] + '.' + workflow + '.json', resume)
+            if is_status_ok :
+                with self.m_timings.measure('workflow', environment=self.m_configuration.get_parameter('global')['environment']) as record :
+                    is_status_ok = self.m_scheduler.run(self.schedule_task, max_parallel)
+                    record['success'] = is_status_ok
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0321, C0301, R0913, R0917
+
+# pylint: disable=C0321, C0301, R0912, R0913, R0917, R0914
+    def fan_out(self, environments, database, key, steps, username = None, max_parallel = 1, max_environments = None, incremental = False, resume = False) :
+        """ Apply the workflow on several environments at the same time, reading configuration and secrets once
+        ---
+        environments     (list)       : Deployment target environments (prod / preprod / staging / dev / ....)
+        database         (str)        : Path to the keepass database in which secrets are stored
+        key              (str)        : Vault key file or name of the environment variable in which vault key is stored
+        steps            (str)        : List of the steps to apply (empty if all steps shall be applied)
+        username         (str)        : Identifier of the vault entry in which AWS credentials to use for deployment are set (under aws-<username>-access-key entry)
+        max_parallel     (int / dict) : Maximum number of independent tasks to apply at the same time in each environment, or in a given environment
+        max_environments (int)        : Maximum number of environments processed at the same time (all of them if None)
+        incremental      (bool)       : True if terraform tasks which inputs did not change since their last successful deployment shall be skipped
+        resume           (bool)       : True if the tasks completed by the previous run of each environment with the same inputs shall be skipped
+        """
+
+        is_status_ok = True
+        results = {}
+
+        try :
+
+            i_step = 2
+            if is_status_ok : self.m_log.info('-- %d   - Extracting secrets from database %s', i_step, database) ; i_step = i_step + 1
+            if is_status_ok : is_status_ok = self.m_configuration.load_secrets(database, key)
+
+            if is_status_ok : self.m_log.info('-- %d   - Initializing deployment workflow', i_step) ; i_step = i_step + 1
+            if is_status_ok : is_status_ok = self.initialize_parameters(username)
+
+            if is_status_ok :
+                workers = len(environments)
+                if max_environments is not None : workers = min(workers, max_environments)
+                with ThreadPoolExecutor(max_workers=max(1, workers)) as executor :
+                    futures = {}
+                    for environment in environments :
+                        limit = max_parallel
+                        if isinstance(max_parallel, dict) : limit = max_parallel.get(environment, 1)
+                        futures[environment] = executor.submit(self.process_environment, environment, steps, limit, incremental, i_step, resume)
+                    for environment in environments : results[environment] = futures[environment].result()
+
+                # Combined summary of all the environments
+                for environment in environments :
+                    if results[environment][0] : self.m_log.info('-- Environment %s succeeded in %.1fs', environment, results[environment][1])
+                    else                       : self.m_log.error('-- Environment %s failed after %.1fs', environment, results[environment][1])
+                is_status_ok = all(result[0] for result in results.values())
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        self.write_timings()
+
+        return is_status_ok
+# pylint: enable=C0321, C0301, R0912, R0913, R0917, R0914
+
+# pylint: disable=C0321, C0301, R0913, R0917
+    def process_environment(self, environment, steps, max_parallel, incremental, first_step, resume = False) :
+        """ Apply the workflow on an environment, in its own orchestrator
+        ---
+        environment  (str)  : Deployment target environment (prod / preprod / staging / dev / ....)
+        steps        (str)  : List of the steps to apply (empty if all steps shall be applied)
+        max_parallel (int)  : Maximum number of independent tasks to apply at the same time
+        incremental  (bool) : True if terraform tasks which inputs did not change since their last successful deployment shall be skipped
+        first_step   (int)  : Number of the first step in logs
+        resume       (bool) : True if the tasks completed by the previous run with the same inputs shall be skipped
+        ---
+        Returns      (tuple) : Workflow status and duration in seconds
+        """
+
+        is_status_ok = True
+        start = perf_counter()
+
+        try :
+            child = self.spawn(environment)
+            if is_status_ok : is_status_ok = child.initialize_steps()
+            if is_status_ok : is_status_ok = child.prefetch_modules()
+            if is_status_ok : is_status_ok = child.execute(steps, max_parallel, incremental, first_step, resume)
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        result = (is_status_ok, perf_counter() - start)
+
+        return result
 
-                is_mandatory = True in [('mandatory' in task and task['mandatory']) for task in self.m_workflow[step]['tasks']] # One of the task is mandatory
-                shall_apply_step = (len(steps) == 0) or (step in steps) or is_mandatory
+    def spawn(self, environment) :
+        """ Create an orchestrator for another environment, sharing the configuration already loaded
+        ---
+        environment  (str)          : Deployment target environment (prod / preprod / staging / dev / ....)
+        ---
+        Returns      (Orchestrator) : Orchestrator of the same class with its own configuration copy and tools
+        """
 
-                if shall_apply_step :
+        result = type(self)(self.m_git_version)
+
+        result.m_log                = getLogger('orchestrator.' + environment)
+        result.m_shall_destroy      = self.m_shall_destroy
+        result.m_s3_backend_bucket  = self.m_s3_backend_bucket
+        result.m_s3_backend_path    = self.m_s3_backend_path
+        result.m_s3_backend_region  = self.m_s3_backend_region
+        result.m_configuration      = self.m_configuration.clone(environment)
+        result.m_gitlab             = self.m_gitlab
+        result.m_fingerprints       = self.m_fingerprints
+        result.m_modules            = self.m_modules
+        result.m_timings            = self.m_timings
+        result.m_plans              = self.m_plans
+        result.m_journaling         = self.m_journaling
+        result.m_terraform.configure_tfvars(self.m_terraform.m_tfvars_format)
+        result.m_terraform.configure_timeouts(self.m_terraform.m_timeouts, self.m_terraform.m_grace)
+        if self.m_shall_destroy : result.m_workflow = result.m_configuration.get_workflow('destruction')
+        else                    : result.m_workflow = result.m_configuration.get_workflow('deployment')
+
+        return result
+# pylint: enable=C0321, C0301, R0913, R0917
+
+# pylint: disable=C0321, C0301, R0912, R0913, R0917, R0914
+    def drift(self, database, key, steps, username = None, max_parallel = 4, report = None) :
+        """ Plan all the terraform tasks of the deployment workflow at the same time, without applying anything,
+        to detect the infrastructure drifts
+        ---
+        database     (str)  : Path to the keepass database in which secrets are stored
+        key          (str)  : Vault key file or name of the environment variable in which vault key is stored
+        steps        (str)  : List of the steps to check (empty if all steps shall be checked)
+        username     (str)  : Identifier of the vault entry in which AWS credentials to use for deployment are set (under aws-<username>-access-key entry)
+        max_parallel (int)  : Maximum number of terraform tasks to plan at the same time
+        report       (str)  : Json file to write the drift report into (None for no report file)
+        """
 
-                    suffix = ''
-                    if is_mandatory : suffix = '[mandatory]'
-                    if is_status_ok : self.m_log.info('-- %d   - %s %s', i_step, self.m_workflow[step]['description'], suffix); i_step = i_step + 1
+        is_status_ok = True
+        tasks = []
 
-                    j_step = 1
-                    for task in self.m_workflow[step]['tasks'] :
+        try :
 
-                        shall_apply_task = (len(steps) == 0) or (step in steps) or (is_mandatory and 'mandatory' in task and task['mandatory'])
-                        if shall_apply_task :
+            if self.m_shall_destroy : raise Exception('Drift can only be checked on the deployment workflow')
 
-                            if is_status_ok : self.m_log.info('-- %d.%d - %s %s', i_step - 1, j_step, task['description'], suffix) ; j_step = j_step + 1
-                            if is_status_ok : is_status_ok = self.apply_task(task, step)
+            i_step = 2
+            if is_status_ok : self.m_log.info('-- %d   - Extracting secrets from database %s', i_step, database) ; i_step = i_step + 1
+            if is_status_ok : is_status_ok = self.m_configuration.load_secrets(database, key)
 
+            if is_status_ok : self.m_log.info('-- %d   - Initializing deployment workflow', i_step) ; i_step = i_step + 1
+            if is_status_ok : is_status_ok = self.initialize(username)
 
+            if is_status_ok : self.m_scheduler = Scheduler()
+            if is_status_ok : is_status_ok = self.m_scheduler.build(self.m_workflow, steps, i_step)
+
+            # Read-only python tasks, such as cidr ranges computation, provide inputs to the terraform tasks,
+            # other python tasks may modify the infrastructure and are skipped
+            for identifier in self.m_scheduler.get_order() :
+                node = self.m_scheduler.get_node(identifier)
+                if is_status_ok and node['task']['type'] == 'python' and node['task']['method'] in self.m_readonly_methods :
+                    self.m_log.info('-- %d.%d - %s', node['step_number'], node['task_number'], node['task']['description'])
+                    is_status_ok = self.apply_task(node['task'], node['step'])
+                elif node['task']['type'] == 'terraform' : tasks.append(identifier)
+
+            if is_status_ok : self.m_log.info('-- Checking drift of %d terraform tasks', len(tasks))
+            if is_status_ok :
+                with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor :
+                    results = list(executor.map(self.drift_task, tasks))
+
+                self.m_drift = {'drift' : False, 'failed' : 0, 'tasks' : {}}
+                for index, identifier in enumerate(tasks) :
+                    self.m_drift['tasks'][identifier] = results[index]
+                    if results[index]['status'] == 'drift'    : self.m_drift['drift'] = True
+                    if results[index]['status'] == 'failed'   : self.m_drift['failed'] = self.m_drift['failed'] + 1
+                    self.m_log.info('-- %s : %s (%d to add, %d to change, %d to destroy)', identifier, results[index]['status'], \
+                        results[index]['add'], results[index]['change'], results[index]['destroy'])
+
+                if report is not None : dump_json_file(self.m_drift, report)
+                is_status_ok = (self.m_drift['failed'] == 0)
 
         except Exception as exc :
             self.m_log.error(str(exc))
             is_status_ok = False
 
+        self.write_timings()
+
         return is_status_ok
+# pylint: enable=C0321, C0301, R0912, R0913, R0917, R0914
+
+# pylint: disable=C0321, C0301
+    def drift_task(self, identifier) :
+        """ Plan a terraform task of the workflow to detect its drift
+        ---
+        identifier (str)  : Identifier of the task in the scheduler graph
+        ---
+        Returns    (dict) : Task step, description, state file, status (unchanged, drift or failed)
+                            and number of resources to add, change and destroy
+        """
+
+        node = self.m_scheduler.get_node(identifier)
+        result = {'step' : node['step'], 'description' : node['task']['description'], 'state' : None, 'status' : 'failed', 'add' : 0, 'change' : 0, 'destroy' : 0}
+
+        try :
+            configuration_key = node['step']
+            if 'key' in node['task'] : configuration_key = node['task']['key']
+
+            self.m_log.info('-- %d.%d - %s', node['step_number'], node['task_number'], node['task']['description'])
+            backend = node['task'].get('backend', 'local')
+            task = self.prepare_terraform(node['task']['path'], node['task']['state'], configuration_key, backend)
+            result['state'] = task['state']
+
+            with self.m_timings.labels(environment=self.m_configuration.get_parameter('global')['environment'], step=node['step'], task=node['task']['description'], type='terraform') :
+                summary = self.m_terraform.plan(task['directory'], task['state'], self.m_s3_backend_bucket, self.m_s3_backend_region, task['configuration'], variables = task['variables'], backend = backend)
+            if summary is not None :
+                result.update({'add' : summary['add'], 'change' : summary['change'], 'destroy' : summary['destroy']})
+                if summary['drift'] : result['status'] = 'drift'
+                else                : result['status'] = 'unchanged'
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+
+        return result
+# pylint: enable=C0321, C0301
+
+# pylint: disable=C0321, C0301
+    def schedule_task(self, identifier) :
+        """ Apply a task from the workflow dependency graph
+        ---
+        identifier (str) : Identifier of the task in the scheduler graph
+        """
+
+        is_status_ok = True
+
+        try :
 
-# pylint: enable=R1702, R0912, C0321, C0301
+            node = self.m_scheduler.get_node(identifier)
+
+            suffix = ''
+            if node['mandatory'] : suffix = '[mandatory]'
+            with self.m_lock :
+                if not node['step'] in self.m_started_steps :
+                    self.m_started_steps.add(node['step'])
+                    self.m_log.info('-- %d   - %s %s', node['step_number'], self.m_workflow[node['step']]['description'], suffix)
+
+            self.m_log.info('-- %d.%d - %s %s', node['step_number'], node['task_number'], node['task']['description'], suffix)
+            is_status_ok = self.apply_task(node['task'], node['step'], identifier)
+
+        except Exception as exc :
+            self.m_log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0321, C0301
@@ -0,0 +1,202 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to run external commands with streamed outputs
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from subprocess import Popen, PIPE
+from threading import Thread, Lock
+from collections import deque
+from gzip import open as gzopen
+from signal import SIGINT, SIGTERM, Signals
+from asyncio import create_subprocess_exec, wait_for, gather, CancelledError
+from asyncio import TimeoutError as AsyncTimeoutError
+
+# Maximum length of an output line read by asynchronous runs
+LINE_LIMIT = 1 << 24
+
+# pylint: disable=R0902, C0301, C0321
+class Process :
+    """ Class running a command and streaming its outputs line by line to a logger and a compressed
+    log file, while keeping only the last lines in memory for error reports. Commands can be run from a
+    thread, or from an event loop without shell """
+
+    m_command   = None
+    m_directory = None
+    m_env       = None
+    m_logfile   = None
+    m_log       = None
+    m_shell     = True
+    m_tail      = None
+    m_callback  = None
+    m_lock      = None
+
+# pylint: disable=R0913, R0917
+    def __init__(self, command, directory = None, env = None, logfile = None, log = None, shell = True, tail = 100, callback = None) :
+        """ Constructor
+        ---
+        command   (str)    : Command to run (list of arguments for asynchronous runs or without shell)
+        directory (str)    : Working directory of the command
+        env       (dict)   : Environment of the command (None to inherit the current one)
+        logfile   (str)    : Gzip file to which outputs are appended (None for no log file)
+        log       (Logger) : Logger receiving the outputs lines
+        shell     (bool)   : True if the command shall be run through the shell
+        tail      (int)    : Number of output lines kept in memory
+        callback  (func)   : Function called with each stdout line (None for no callback)
+        """
+        self.m_command      = command
+        self.m_directory    = directory
+        self.m_env          = env
+        self.m_logfile      = logfile
+        self.m_log          = log
+        self.m_shell        = shell
+        self.m_tail         = deque(maxlen=tail)
+        self.m_callback     = callback
+        self.m_lock         = Lock()
+        if self.m_log is None : self.m_log = getLogger('process')
+# pylint: enable=R0913, R0917
+
+    def get_tail(self) :
+        """ Last output lines accessor
+        ---
+        Returns (str) : Last lines of the command stdout and stderr
+        """
+
+        with self.m_lock :
+            result = '\n'.join(self.m_tail)
+
+        return result
+
+# pylint: disable=R1732
+    def run(self) :
+        """ Run the command until it completes
+        ---
+        Returns (int) : Command return code
+        """
+
+        logfile = None
+        if self.m_logfile is not None : logfile = gzopen(self.m_logfile, 'at', encoding='UTF-8')
+
+        try :
+            process = Popen(self.m_command, cwd=self.m_directory, env=self.m_env, shell=self.m_shell, \
+                            stdout=PIPE, stderr=PIPE, encoding='UTF-8', errors='replace')
+            readers = [ \
+                Thread(target=self.drain, args=(process.stdout, False, logfile), daemon=True), \
+                Thread(target=self.drain, args=(process.stderr, True, logfile), daemon=True)]
+            for reader in readers : reader.start()
+            for reader in readers : reader.join()
+            result = process.wait()
+
+        finally :
+            if logfile is not None : logfile.close()
+
+        return result
+# pylint: enable=R1732
+
+# pylint: disable=R1732
+    async def run_async(self, timeout = None, grace = 30) :
+        """ Run the command without shell until it completes, from an event loop. When the run is cancelled
+        or times out, the command is interrupted with SIGINT, then with SIGTERM if it is still running after
+        the grace period, so that terraform may release its state lock
+        ---
+        timeout (float) : Maximum duration of the command in seconds (None for no limit)
+        grace   (float) : Duration left to the command to stop after each interruption signal, in seconds
+        ---
+        Returns (int)   : Command return code
+        """
+
+        logfile = None
+        if self.m_logfile is not None : logfile = gzopen(self.m_logfile, 'at', encoding='UTF-8')
+
+        try :
+            process = await create_subprocess_exec(*self.m_command, cwd=self.m_directory, env=self.m_env, \
+                                                   stdout=PIPE, stderr=PIPE, limit=LINE_LIMIT)
+            readers = gather( \
+                self.drain_async(process.stdout, False, logfile), \
+                self.drain_async(process.stderr, True, logfile))
+            try :
+                result = await wait_for(process.wait(), timeout)
+            except AsyncTimeoutError :
+                await self.interrupt(process, grace)
+                raise Exception('Command timed out after ' + str(timeout) + 's') from None
+            except CancelledError :
+                await self.interrupt(process, grace)
+                raise
+            finally :
+                await readers
+
+        finally :
+            if logfile is not None : logfile.close()
+
+        return result
+# pylint: enable=R1732
+
+    async def interrupt(self, process, grace) :
+        """ Stop a running command, gracefully first
+        ---
+        process (Process) : Asynchronous process running the command
+        grace   (float)   : Duration left to the command to stop after each signal, in seconds
+        """
+
+        for signal in (SIGINT, SIGTERM) :
+            if process.returncode is None :
+                self.m_log.warning('Sending %s to command', Signals(signal).name)
+                try :
+                    process.send_signal(signal)
+                    await wait_for(process.wait(), grace)
+                except (ProcessLookupError, AsyncTimeoutError) : pass
+
+        if process.returncode is None :
+            self.m_log.warning('Killing command')
+            try : process.kill()
+            except ProcessLookupError : pass
+            await process.wait()
+
+    def drain(self, stream, is_error, logfile) :
+        """ Forward a command output stream line by line
+        ---
+        stream   (file) : Command output stream
+        is_error (bool) : True if the stream is the command stderr
+        logfile  (file) : Log file to write lines into (None for no log file)
+        """
+
+        for line in stream : self.forward(line.rstrip('\n'), is_error, logfile)
+
+        stream.close()
+
+    async def drain_async(self, stream, is_error, logfile) :
+        """ Forward an asynchronous command output stream line by line
+        ---
+        stream   (StreamReader) : Command output stream
+        is_error (bool)         : True if the stream is the command stderr
+        logfile  (file)         : Log file to write lines into (None for no log file)
+        """
+
+        line = await stream.readline()
+        while line :
+            self.forward(line.decode('UTF-8', 'replace').rstrip('\n'), is_error, logfile)
+            line = await stream.readline()
+
+    def forward(self, line, is_error, logfile) :
+        """ Forward a command output line to the logger, the callback, the log file and the last lines
+        ---
+        line     (str)  : Output line, without end of line
+        is_error (bool) : True if the line comes from the command stderr
+        logfile  (file) : Log file to write the line into (None for no log file)
+        """
+
+        if is_error : self.m_log.warning(line)
+        else        : self.m_log.debug(line)
+        if not is_error and self.m_callback is not None : self.m_callback(line)
+        with self.m_lock :
+            self.m_tail.append(line)
+            if logfile is not None : logfile.write(('[stderr] ' if is_error else '') + line + '\n')
+# pylint: enable=R0902, C0301, C0321
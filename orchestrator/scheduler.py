@@ -0,0 +1,372 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to schedule workflow tasks from their dependencies
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Logging configuration
+log = getLogger('scheduler')
+
+# pylint: disable=C0301, C0321
+class Scheduler :
+    """ Class building a dependency graph from a workflow and executing it on a bounded pool
+
+    Each step and each task may declare a depends_on list. A step depends_on entry is the
+    name of another step. A task depends_on entry is either a step name (the task then waits
+    for all the tasks of that step), a task identifier <step>.<task> or the name of a task of
+    the same step. Tasks are identified by their name feature if any, by their position in the
+    step otherwise (starting from 1). When no depends_on is given, a step depends on the previous
+    step and a task on the previous task of its step, which keeps legacy workflows sequential.
+    """
+
+    m_nodes         = None
+    m_order         = None
+    m_dependencies  = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_nodes        = {}
+        self.m_order        = []
+        self.m_dependencies = {}
+
+    def get_node(self, identifier) :
+        """ Node accessor
+        ---
+        identifier (str) : Task identifier in the graph
+        ---
+        Returns   (dict) : Node with step name, task description and numbering
+        """
+
+        result = None
+
+        if not identifier in self.m_nodes : raise Exception('Task ' + identifier + ' not found in workflow')
+        result = self.m_nodes[identifier]
+
+        return result
+
+    def get_dependencies(self, identifier) :
+        """ Task dependencies accessor
+        ---
+        identifier (str) : Task identifier in the graph
+        ---
+        Returns    (set) : Identifiers of the scheduled tasks the task waits for
+        """
+
+        result = set()
+        if identifier in self.m_dependencies : result = self.m_dependencies[identifier]
+
+        return result
+
+    def get_order(self) :
+        """ Scheduled tasks accessor
+        ---
+        Returns (list) : Task identifiers in workflow order
+        """
+
+        result = self.m_order
+
+        return result
+
+    def build(self, workflow, steps, first_step = 1) :
+        """ Build the dependency graph of the tasks to apply
+        ---
+        workflow   (dict) : Workflow to schedule
+        steps      (list) : List of the steps to apply (empty if all steps shall be applied)
+        first_step (int)  : Number of the first step in console logs
+        """
+
+        is_status_ok = True
+
+        try :
+
+            self.m_nodes = {}
+            self.m_order = []
+            self.m_dependencies = {}
+
+            tasks = self.identify(workflow)
+            dependencies = self.gather(workflow, tasks)
+            selected = self.select(workflow, tasks, steps, first_step)
+            self.check(dependencies)
+
+            # Tasks that are not applied are replaced by their own dependencies
+            resolved = {}
+            for identifier in self.m_order :
+                self.m_dependencies[identifier] = set()
+                for dependency in dependencies[identifier] :
+                    self.m_dependencies[identifier] = self.m_dependencies[identifier] | self.resolve(dependency, dependencies, selected, resolved)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def identify(self, workflow) :
+        """ Identify every task of the workflow
+        ---
+        workflow (dict) : Workflow to schedule
+        ---
+        Returns  (dict) : Identifiers of the tasks of each step, in the step order
+        """
+
+        result = {}
+        identifiers = []
+
+        for step in workflow :
+            result[step] = []
+            for index, task in enumerate(workflow[step]['tasks']) :
+                name = str(index + 1)
+                if 'name' in task : name = task['name']
+                result[step].append(step + '.' + name)
+                identifiers.append(step + '.' + name)
+        if len(set(identifiers)) != len(identifiers) : raise Exception('Task identifiers are not unique in workflow')
+
+        return result
+
+    def gather(self, workflow, tasks) :
+        """ Gather the dependencies of the whole workflow
+        ---
+        workflow (dict) : Workflow to schedule
+        tasks    (dict) : Identifiers of the tasks of each step
+        ---
+        Returns  (dict) : Declared dependencies of every task in workflow
+        """
+
+        result = {}
+        previous_step = None
+
+        for step in workflow :
+            step_dependencies = []
+            if 'depends_on' in workflow[step] : step_dependencies = workflow[step]['depends_on']
+            elif previous_step is not None    : step_dependencies = [previous_step]
+            previous_step = step
+
+            step_tasks = []
+            for dependency in step_dependencies :
+                if not dependency in tasks : raise Exception('Step ' + step + ' depends on unknown step ' + dependency)
+                step_tasks = step_tasks + tasks[dependency]
+
+            for index, task in enumerate(workflow[step]['tasks']) :
+                identifier = tasks[step][index]
+                result[identifier] = list(step_tasks)
+                if 'depends_on' in task : result[identifier] = result[identifier] + self.task_dependencies(step, identifier, task['depends_on'], tasks)
+                elif index > 0 : result[identifier].append(tasks[step][index - 1])
+
+        return result
+
+    def task_dependencies(self, step, identifier, depends_on, tasks) :
+        """ Resolve the depends_on entries of a task
+        ---
+        step       (str)  : Step of the task
+        identifier (str)  : Task identifier
+        depends_on (list) : Step names, task identifiers or names of tasks of the same step
+        tasks      (dict) : Identifiers of the tasks of each step
+        ---
+        Returns    (list) : Identifiers of the tasks the task depends on
+        """
+
+        result = []
+        identifiers = [task for step_tasks in tasks.values() for task in step_tasks]
+
+        for dependency in depends_on :
+            if dependency in tasks                              : result = result + tasks[dependency]
+            elif dependency in identifiers                      : result.append(dependency)
+            elif step + '.' + dependency in identifiers         : result.append(step + '.' + dependency)
+            else : raise Exception('Task ' + identifier + ' depends on unknown task ' + dependency)
+
+        return result
+
+    def select(self, workflow, tasks, steps, first_step) :
+        """ Select the tasks to apply, numbering them for console logs
+        ---
+        workflow   (dict) : Workflow to schedule
+        tasks      (dict) : Identifiers of the tasks of each step
+        steps      (list) : List of the steps to apply (empty if all steps shall be applied)
+        first_step (int)  : Number of the first step in console logs
+        ---
+        Returns    (dict) : Selected task identifiers
+        """
+
+        result = {}
+        i_step = first_step
+
+        for step in workflow :
+
+            is_mandatory = True in [('mandatory' in task and task['mandatory']) for task in workflow[step]['tasks']] # One of the task is mandatory
+            shall_apply_step = (len(steps) == 0) or (step in steps) or is_mandatory
+
+            if shall_apply_step :
+                j_step = 1
+                for index, task in enumerate(workflow[step]['tasks']) :
+                    shall_apply_task = (len(steps) == 0) or (step in steps) or (is_mandatory and 'mandatory' in task and task['mandatory'])
+                    if shall_apply_task :
+                        identifier = tasks[step][index]
+                        result[identifier] = True
+                        self.m_order.append(identifier)
+                        self.m_nodes[identifier] = {'step' : step, 'task' : task, 'step_number' : i_step, 'task_number' : j_step, 'mandatory' : is_mandatory}
+                        j_step = j_step + 1
+                i_step = i_step + 1
+
+        return result
+
+    def check(self, dependencies) :
+        """ Check the workflow can be ordered
+        ---
+        dependencies (dict) : Declared dependencies of every task in workflow
+        """
+
+        remaining = dict(dependencies)
+        while len(remaining) > 0 :
+            ready = [identifier for identifier, required in remaining.items() if len(set(required) & set(remaining)) == 0]
+            if len(ready) == 0 : raise Exception('Dependency cycle detected between tasks ' + ', '.join(remaining))
+            for identifier in ready : remaining.pop(identifier)
+
+# pylint: disable=R0912, R0914
+    def reverse(self, workflow) :
+        """ Derive a destruction workflow from a deployment workflow, by reversing its dependency graph
+
+        A terraform task is destroyed once all the terraform tasks depending on it in deployment are destroyed.
+        Its pre_destroy python tasks (for example empty_buckets) are applied in sequence right before it.
+        Python tasks of the deployment are only kept if their on_destroy feature is set : they are applied
+        in sequence before all destructions (true or first), or after all of them (last).
+        ---
+        workflow (dict) : Deployment workflow
+        ---
+        Returns  (dict) : Destruction workflow with the same steps, in which all dependencies are explicit
+        """
+
+        if not self.build(workflow, []) : raise Exception('Unable to build the deployment dependency graph')
+
+        features = ('name', 'depends_on', 'on_destroy', 'pre_destroy')
+        stacks = [identifier for identifier in self.m_order if self.m_nodes[identifier]['task']['type'] == 'terraform']
+        first = [identifier for identifier in self.m_order if self.m_nodes[identifier]['task'].get('on_destroy') in (True, 'first')]
+        last = [identifier for identifier in self.m_order if self.m_nodes[identifier]['task'].get('on_destroy') == 'last']
+
+        # Terraform tasks depending on each terraform task, through the python tasks that are not kept
+        selected = {identifier : True for identifier in stacks}
+        resolved = {}
+        dependents = {identifier : [] for identifier in stacks}
+        for identifier in stacks :
+            for dependency in self.m_dependencies[identifier] :
+                for stack in self.resolve(dependency, self.m_dependencies, selected, resolved) : dependents[stack].append(identifier)
+
+        result = {}
+        for step in reversed(list(workflow)) :
+            result[step] = {key : value for key, value in workflow[step].items() if key not in ('tasks', 'depends_on')}
+            result[step]['depends_on'] = []
+            result[step]['tasks'] = []
+        pre_tasks = {step : [] for step in workflow}
+
+        previous = []
+        for identifier in self.m_order :
+            node = self.m_nodes[identifier]
+            task = {key : value for key, value in node['task'].items() if key not in features}
+            task['name'] = identifier[len(node['step']) + 1:]
+
+            if identifier in first :
+                task['depends_on'] = list(previous)
+                previous = [identifier]
+            elif identifier in stacks :
+                task['depends_on'] = first + sorted(set(dependents[identifier]))
+                for index, pre_task in enumerate(node['task'].get('pre_destroy', [])) :
+                    pre_task = dict(pre_task)
+                    pre_task['type'] = 'python'
+                    pre_task['name'] = task['name'] + '-pre-destroy-' + str(index + 1)
+                    pre_task['depends_on'] = task['depends_on']
+                    if 'mandatory' in task : pre_task['mandatory'] = task['mandatory']
+                    pre_tasks[node['step']].append(pre_task)
+                    task['depends_on'] = [node['step'] + '.' + pre_task['name']]
+            elif identifier in last :
+                task['depends_on'] = first + stacks + [step + '.' + pre_task['name'] for step, tasks in pre_tasks.items() for pre_task in tasks]
+                if identifier != last[0] : task['depends_on'] = [last[last.index(identifier) - 1]]
+            else : continue
+
+            result[node['step']]['tasks'].append(task)
+
+        # Pre destruction tasks are listed after the deployment ones, so that steps keep their tasks positions
+        for step, tasks in pre_tasks.items() : result[step]['tasks'] = result[step]['tasks'] + tasks
+
+        # Steps without any task left are removed
+        result = {step : value for step, value in result.items() if len(value['tasks']) > 0}
+
+        return result
+# pylint: enable=R0912, R0914
+
+    def resolve(self, identifier, dependencies, selected, resolved) :
+        """ Compute the selected tasks standing for a task in its dependents dependencies
+        ---
+        identifier   (str)  : Task to resolve
+        dependencies (dict) : Declared dependencies of every task in workflow
+        selected     (dict) : Tasks that will be applied
+        resolved     (dict) : Already resolved unselected tasks
+        ---
+        Returns      (set)  : The task itself if it is applied, its resolved dependencies otherwise
+        """
+
+        result = set()
+
+        if identifier in selected   : result = {identifier}
+        elif identifier in resolved : result = resolved[identifier]
+        else :
+            for dependency in dependencies[identifier] :
+                result = result | self.resolve(dependency, dependencies, selected, resolved)
+            resolved[identifier] = result
+
+        return result
+
+    def run(self, function, max_parallel = 1) :
+        """ Apply all the tasks in the graph, running independent tasks at the same time
+        ---
+        function     (func) : Function applying a task from its identifier and returning its status
+        max_parallel (int)  : Maximum number of tasks running at the same time
+        """
+
+        is_status_ok = True
+
+        try :
+
+            done = set()
+            running = {}
+            pending = list(self.m_order)
+
+            with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor :
+
+                while is_status_ok and (len(pending) > 0 or len(running) > 0) :
+
+                    # Launch every task which dependencies are fulfilled
+                    for identifier in list(pending) :
+                        if len(running) < max(1, max_parallel) and self.m_dependencies[identifier] <= done :
+                            pending.remove(identifier)
+                            running[executor.submit(function, identifier)] = identifier
+
+                    if len(running) == 0 : raise Exception('No task can be scheduled : ' + ', '.join(pending))
+
+                    # Wait for a task to complete and stop launching tasks on the first failure
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished :
+                        identifier = running.pop(future)
+                        if future.result() : done.add(identifier)
+                        else :
+                            log.error('Task %s failed - waiting for running tasks to complete', identifier)
+                            is_status_ok = False
+
+                # Let running tasks complete before leaving
+                for future in wait(running).done :
+                    if not future.result() : log.error('Task %s failed', running[future])
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0301, C0321
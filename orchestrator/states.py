@@ -0,0 +1,170 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to read terraform states outputs from any backend
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import path, makedirs, replace, fdopen, remove
+from hashlib import sha256
+from shutil import copyfileobj
+from threading import Lock
+from copy import deepcopy
+from tempfile import mkstemp
+
+# AWS includes
+from botocore.exceptions import ClientError
+
+# Local includes
+from orchestrator.utils import load_state_outputs
+
+# Logging configuration
+log = getLogger('states')
+
+# pylint: disable=C0301, C0321
+class States :
+    """ Class providing terraform states outputs, whether states are stored locally or in an s3 backend.
+    S3 states are downloaded in a cache directory and only downloaded again when their etag changed,
+    and outputs are read at most once per run unless terraform writes the state """
+
+    m_buckets   = None
+    m_cache     = None
+    m_memo      = None
+    m_locks     = None
+    m_lock      = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_buckets  = None
+        self.m_cache    = None
+        self.m_memo     = {}
+        self.m_locks    = {}
+        self.m_lock     = Lock()
+
+    def configure(self, buckets, cache = None) :
+        """ Configure the s3 access and the local copies of s3 states
+        ---
+        buckets (Buckets) : Configured s3 buckets manager, providing the s3 clients
+        cache   (str)     : Directory in which s3 states are kept between runs (None if s3 states are not used)
+        """
+
+        is_status_ok = True
+
+        try :
+            self.m_buckets = buckets
+            self.m_cache = cache
+            if self.m_cache is not None : makedirs(self.m_cache, mode=0o700, exist_ok=True)
+            with self.m_lock : self.m_memo = {}
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def get_outputs(self, state, backend = 'local', bucket = None, region = None) :
+        """ Read the outputs of a terraform state
+        ---
+        state   (str)  : State file (filename for local backend, s3 object name with path for s3 backend)
+        backend (str)  : Local or s3
+        bucket  (str)  : Bucket hosting the states for s3 backend
+        region  (str)  : Region of the bucket (session region if not provided)
+        ---
+        Returns (dict) : Content of the top-level outputs object of the state
+        """
+
+        if backend == 'local'   : result = load_state_outputs(state)
+        elif backend == 's3'    : result = self.get_s3_outputs(bucket, state, region)
+        else                    : raise Exception('Unmanaged backend type ' + backend)
+
+        return result
+
+    def get_s3_outputs(self, bucket, key, region = None) :
+        """ Read the outputs of a terraform state stored in s3
+        ---
+        bucket  (str)  : Bucket hosting the state
+        key     (str)  : State object key
+        region  (str)  : Region of the bucket (session region if not provided)
+        ---
+        Returns (dict) : Content of the top-level outputs object of the state
+        """
+
+        # Tasks reading the same state at the same time wait for a single download
+        with self.m_lock :
+            lock = self.m_locks.setdefault((bucket, key), Lock())
+
+        with lock :
+
+            with self.m_lock :
+                result = self.m_memo.get((bucket, key))
+
+            if result is None :
+
+                client = self.m_buckets.m_client
+                if region is not None : client = self.m_buckets.get_client(region)
+
+                if self.m_cache is None : raise Exception('S3 states can only be read with a cache directory')
+
+                etag = None
+                filename = self.m_cache + '/' + sha256((bucket + '/' + key).encode('UTF-8')).hexdigest() + '.tfstate'
+                if path.isfile(filename) and path.isfile(filename + '.etag') :
+                    with open(filename + '.etag', 'r', encoding='UTF-8') as fid : etag = fid.read()
+
+                try :
+                    if etag is not None : response = client.get_object(Bucket=bucket, Key=key, IfNoneMatch=etag)
+                    else                : response = client.get_object(Bucket=bucket, Key=key)
+                except ClientError as exc :
+                    if exc.response['Error']['Code'] in ('304', 'NotModified') : response = None
+                    elif exc.response['Error']['Code'] in ('404', 'NoSuchKey') : raise Exception('State ' + key + ' not found in bucket ' + bucket) from exc
+                    else : raise
+
+                if response is None : log.debug('-------- State %s unchanged since last download', key)
+                else :
+                    log.debug('-------- Downloading state %s from bucket %s', key, bucket)
+                    self.download(response, filename)
+
+                result = load_state_outputs(filename)
+                with self.m_lock : self.m_memo[(bucket, key)] = result
+
+        result = deepcopy(result)
+
+        return result
+
+# pylint: disable=R0201
+    def download(self, response, filename) :
+        """ Write a downloaded state in the cache, through a temporary file of its own so that an other
+        orchestrator sharing the cache never reads a partial state
+        ---
+        response (dict) : S3 get_object response
+        filename (str)  : Cached state file
+        """
+
+        # States contain secrets, they are only readable by their owner, as temporary files are
+        (descriptor, temporary) = mkstemp(dir=path.dirname(filename), suffix='.tmp')
+        try :
+            with fdopen(descriptor, 'wb') as fid : copyfileobj(response['Body'], fid, 1 << 20)
+            replace(temporary, filename)
+        except Exception :
+            if path.isfile(temporary) : remove(temporary)
+            raise
+        with open(filename + '.etag', 'w', encoding='UTF-8') as fid : fid.write(response['ETag'])
+# pylint: enable=R0201
+
+    def forget(self, state, backend = 'local', bucket = None) :
+        """ Forget the outputs read for a state, for example once terraform wrote it
+        ---
+        state   (str) : State file (filename for local backend, s3 object name with path for s3 backend)
+        backend (str) : Local or s3
+        bucket  (str) : Bucket hosting the states for s3 backend
+        """
+
+        if backend == 's3' :
+            with self.m_lock : self.m_memo.pop((bucket, state), None)
+# pylint: enable=C0301, C0321
@@ -12,36 +12,87 @@
 
 # System includes
 from logging import getLogger
-from os import path, remove
-from shutil import rmtree
-from subprocess import Popen, PIPE
-from json import dumps
-from functools import reduce
-from operator import add
+from os import path, remove, makedirs, environ, listdir, chmod, symlink, replace, sep
+from json import dump
+from hashlib import sha256
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp, gettempdir
+from re import compile as regex
+from threading import Lock
+from contextlib import nullcontext, asynccontextmanager, contextmanager
+from asyncio import run as run_loop, sleep
+
+# Local includes
+from orchestrator.process import Process
+from orchestrator.utils import forget_state_outputs, git_environment
 
 # Logging configuration
 log = getLogger('terraform')
 
+# Lines of terraform files that require a new initialization when modified
+init_pattern = regex(r'\b(source|version)\s*=|^\s*backend\s+"')
+
+# The plugin cache is shared by all terraform instances and not safe for concurrent initializations
+init_lock = Lock()
+
+# Plan summary counts ("Plan: 1 to add, 0 to change, 2 to destroy.")
+plan_pattern = regex(r'(\d+) to (add|change|destroy)')
+
+# pylint: disable=C0321
+@asynccontextmanager
+async def acquire(lock) :
+    """ Acquire a lock shared between threads without blocking the event loop
+    ---
+    lock (Lock) : Lock to acquire
+    """
+
+    while not lock.acquire(blocking=False) : await sleep(0.05)
+    try :
+        yield lock
+    finally :
+        lock.release()
+# pylint: enable=C0321
+
+# pylint: disable=R0904
 class Terraform :
-    """ Class managing terraform application """
+    """ Class managing terraform application. Terraform commands are run without shell,
+    from an event loop through the asynchronous methods, or through their blocking counterparts """
 
     m_region = None
 
     m_access_key = None
     m_secret_key = None
 
+    m_cache = None
+    m_root = None
+    m_timings = None
+    m_tfvars_format = 'hcl'
+    m_timeouts = None
+    m_grace = 30
+    m_git = None
+
     def __init__(self):
         """ Constructor """
         self.m_region = None
         self.m_access_key = None
         self.m_secret_key = None
-
-    def configure(self, access_key, secret_key, region) :
+        self.m_cache = None
+        self.m_root = None
+        self.m_timings = None
+        self.m_tfvars_format = 'hcl'
+        self.m_timeouts = {}
+        self.m_grace = 30
+        self.m_git = []
+
+# pylint: disable=C0301
+    def configure(self, access_key, secret_key, region, cache = None, timings = None) :
         """ Configure terraform AWS credentials
         ---
         access_key      (str)  : AWS access key to use for this deployment
         secret_key      (str)  : AWS secret key to use for this deployment
         region          (str)  : AWS region in which the deployment shall occur
+        cache           (str)     : Directory in which providers and terraform data are kept between runs
+        timings         (Timings) : Recorder of the terraform phases durations (None for no recording)
         """
 
         is_status_ok = True
@@ -50,6 +101,86 @@ class Terraform :
             self.m_region = region
             self.m_access_key = access_key
             self.m_secret_key = secret_key
+            self.m_timings = timings
+            if cache is not None :
+                self.m_cache = path.abspath(cache)
+                makedirs(self.m_cache + '/plugins', exist_ok=True)
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0301
+
+# pylint: disable=C0301, C0321
+    def configure_tfvars(self, tfvars_format = 'hcl') :
+        """ Select the terraform configuration files format
+        ---
+        tfvars_format   (str)  : hcl for conf.tfvars files, json for conf.tfvars.json files read natively by terraform
+        """
+
+        is_status_ok = True
+
+        try :
+            if tfvars_format not in ('hcl', 'json') : raise Exception('Unmanaged tfvars format ' + tfvars_format)
+            self.m_tfvars_format = tfvars_format
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def configure_timeouts(self, timeouts = None, grace = 30) :
+        """ Limit the duration of the terraform commands
+        ---
+        timeouts        (dict)  : Maximum duration in seconds of each terraform phase (init, plan, apply, destroy), phases without timeout are not limited
+        grace           (float) : Duration left to terraform to stop after each interruption signal (SIGINT, then SIGTERM), in seconds
+        """
+
+        is_status_ok = True
+
+        try :
+            if timeouts is None : timeouts = {}
+            for phase in timeouts :
+                if phase not in ('init', 'plan', 'apply', 'destroy') : raise Exception('Unmanaged terraform phase ' + phase)
+            self.m_timeouts = dict(timeouts)
+            self.m_grace = grace
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def configure_git(self, entries = None) :
+        """ Set the git configuration of the terraform processes, for example to retrieve modules with credentials
+        ---
+        entries         (list)  : Git configuration keys and values, provided through the terraform processes environment only
+        """
+
+        is_status_ok = True
+
+        self.m_git = []
+        if entries is not None : self.m_git = list(entries)
+
+        return is_status_ok
+
+    def configure_workspaces(self, root = None) :
+        """ Run the terraform commands in scratch workspaces mirroring the terraform files root, so that runs sharing
+        the working directories never write into them
+        ---
+        root            (str)   : Directory containing the terraform working directories and their local modules (None to run terraform in the working directories)
+        """
+
+        is_status_ok = True
+
+        try :
+            self.m_root = None
+            if root is not None :
+                if not path.isdir(root) : raise Exception('Terraform root ' + root + ' not found')
+                self.m_root = path.realpath(root)
+
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
@@ -59,7 +190,7 @@ class Terraform :
     def create_configuration_file(self, output_file, variables) :
         """ Create terraform configuration file from a list of variables to write
         ---
-        output_file (str)  : The configuration file enriched with external or secret parameters
+        output_file (str)  : The configuration file enriched with external or secret parameters (json if it ends with .json, hcl otherwise)
         variables   (dict) : The list of variables (key and value) to add to the configuration file
         """
 
@@ -67,137 +198,603 @@ class Terraform :
 
         try :
 
-            configuration = reduce(add, self.recurse(variables), "")
             log.info("-------- Writing terraform configuration file %s", output_file)
-            log.debug(dumps(configuration))
 
-            with open(output_file,'w', encoding='UTF-8') as configuration_fid:
-                configuration_fid.write(configuration)
+            # Tokens are streamed to the file rather than gathered, since file parameters may be large
+            with open(output_file, 'w', encoding='UTF-8', buffering=1 << 16) as configuration_fid :
+                if output_file.endswith('.json') : dump(variables, configuration_fid)
+                else : configuration_fid.writelines(self.recurse(variables))
+
+            log.debug("-------- Wrote %d bytes", path.getsize(output_file))
 
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
+# pylint: enable=C0301, C0321
+
+# pylint: disable=C0301, R0913, R0917
+    def apply(self, directory, state, bucket, region, configuration, variables = None, backend='local', plan_key = None) :
+        """ Initialize, plan and apply terraform on a given configuration, blocking until completion (see apply_async) """
+
+        result = run_loop(self.apply_async(directory, state, bucket, region, configuration, variables, backend, plan_key))
 
-# pylint: disable=C0301, W0102, R0913, R0914, C0321, R1732
-    def apply(self, directory, state, bucket, region, configuration, variables = {}, backend='local') :
+        return result
+
+    def save_plan(self, directory, state, bucket, region, configuration, key, variables = None, backend='local') :
+        """ Initialize and plan terraform on a given configuration, saving the plan, blocking until completion (see save_plan_async) """
+
+        result = run_loop(self.save_plan_async(directory, state, bucket, region, configuration, key, variables, backend))
+
+        return result
+
+    def destroy(self, directory, state, bucket, region, configuration, variables = None, backend='local') :
+        """ Destroy an existing configuration, blocking until completion (see destroy_async) """
+
+        result = run_loop(self.destroy_async(directory, state, bucket, region, configuration, variables, backend))
+
+        return result
+
+    def plan(self, directory, state, bucket, region, configuration, variables = None, backend='local') :
+        """ Initialize and plan terraform on a given configuration, blocking until completion (see plan_async) """
+
+        result = run_loop(self.plan_async(directory, state, bucket, region, configuration, variables, backend))
+
+        return result
+# pylint: enable=C0301, R0913, R0917
+
+# pylint: disable=C0301, R0913, R0917, R0914, C0321
+    async def apply_async(self, directory, state, bucket, region, configuration, variables = None, backend='local', plan_key = None) :
         """ Initialize, plan and apply terraform on a given configuration
         ---
-        directory     (str) : Working directory for terraform
-        state         (str) : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
-        region        (str) : Deployment region for backend configuration
-        configuration (str) : Configuration file to use for terraform configuration (tfvars)
-        variables     (str) : Additional variables to set via command line (secrets)
-        backend       (str) : Local or s3 (shall match the terraform jobs configuration)
+        directory     (str)  : Working directory for terraform
+        state         (str)  : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
+        region        (str)  : Deployment region for backend configuration
+        configuration (str)  : Configuration file to use for terraform configuration (tfvars)
+        variables     (str)  : Additional variables to set via command line (secrets)
+        backend       (str)  : Local or s3 (shall match the terraform jobs configuration)
+        plan_key      (str)  : Key of the task inputs and state version. The plan saved by a previous run with the same key
+                               is applied without planning again (None to always plan)
+        ---
+        Returns       (bool) : True if the configuration was applied
         """
         is_status_ok = True
 
         try :
 
-            other_parameters = ''
-            for key in variables :
-                other_parameters = other_parameters + ' -var="' + key + '=' + variables[key] + '"'
+            environment = self.environment(directory, state, backend)
+            logfile = self.logfile(directory, state, backend)
+            if logfile is not None and path.isfile(logfile) : remove(logfile)
+            # Terraform writes its lock file and local data in the workspace, not in the shared working directory
+            with self.workspace(directory, state, backend) as workdir :
+                if not await self.init_async(directory, state, bucket, region, backend, environment, workdir) : raise Exception('Initialization failed')
+
+                plan = None
+                if plan_key is not None : plan = self.saved_plan(directory, state, backend, plan_key)
+
+                if plan is not None : log.info("-------- Using plan saved for the same inputs and state")
+                else :
+                    # Keep the plan in the task data directory, so that tasks sharing a working directory do not clobber it
+                    plan = 'tfplan'
+                    if 'TF_DATA_DIR' in environment : plan = environment['TF_DATA_DIR'] + '/tfplan'
+
+                    log.info("-------- Planning deployment")
+                    cmd = ['terraform', 'plan', '-no-color', '-out=' + plan, '-input=false'] + self.arguments(state, configuration, variables)
+                    with self.measure('plan', state) as record : record['success'] = await self.execute_async(cmd, workdir, environment, logfile, self.timeout('plan'))
+                    if not record['success'] : raise Exception('Planification failed')
+
+                log.info("-------- Executing deployment")
+                # Parallelism is set to one to avoid issues when creating acl rules with count.
+                cmd = ['terraform', 'apply', '-no-color', '-input=false', plan]
+                with self.measure('apply', state) as record : record['success'] = await self.execute_async(cmd, workdir, environment, logfile, self.timeout('apply'))
+                # Once applied, even partially, the state changed : the saved plan can not be applied anymore and its outputs shall be read again
+                self.forget_plan(directory, state, backend)
+                forget_state_outputs(state)
+                if not record['success'] : raise Exception('Application failed')
 
-            tf_data_dir = directory + '/.terraform'
-            if path.exists(tf_data_dir) : rmtree(tf_data_dir)
-            if path.exists(tf_data_dir + '.lock.hcl') : remove(tf_data_dir + '.lock.hcl')
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
 
-            log.info("-------- Initializing terraform for backend %s", backend)
-            if backend == 'local' :
-                cmd = 'terraform init -input=false -backend-config="path=' + state + '"'
-            elif backend == 's3' :
-                cmd = 'terraform init -input=false -backend-config="bucket=' + bucket + ' -backend-config="key=' + state + '" -backend-config="region=' + region + '""'
-            else : raise Exception('Unmanaged backend type ' + backend)
-            log.debug('-------- Command : %s', cmd)
-            process = Popen(cmd, cwd=directory, stdout=PIPE, shell=True)
-            (output,err) = process.communicate()
-            log.debug(output)
-            if process.returncode > 0 :
-                log.error(err)
-                raise Exception('Initialization failed')
-
-            log.info("-------- Planning deployment")
-            cmd = 'terraform plan -no-color -out=tfplan -input=false -var-file=' + configuration + ' -var="region=' + self.m_region + '" -var="access_key=' + self.m_access_key + '" -var="secret_key=' + self.m_secret_key + '" -state=' + state + other_parameters
-            log.debug('-------- Command : %s', cmd)
-            process = Popen(cmd, cwd=directory, stdout=PIPE, shell=True)
-            (output,err) = process.communicate()
-            log.debug(output)
-            if process.returncode > 0 :
-                log.error(err)
-                raise Exception('Planification failed')
-
-            log.info("-------- Executing deployment")
-            # Parallelism is set to one to avoid issues when creating acl rules with count.
-            cmd = 'terraform apply -no-color -input=false tfplan'
-            log.debug('---- Command : %s', cmd)
-            process = Popen(cmd , cwd=directory, stdout=PIPE, shell=True)
-            (output,err) = process.communicate()
-            log.debug(output)
-            if process.returncode > 0 :
-                log.error(err)
-                raise Exception('Application failed')
+        return is_status_ok
+# pylint: enable=C0301, R0913, R0917, R0914, C0321
+
+# pylint: disable=C0301, R0913, R0917, R0914, C0321
+    async def save_plan_async(self, directory, state, bucket, region, configuration, key, variables = None, backend='local') :
+        """ Initialize and plan terraform on a given configuration, saving the plan to apply it in a later run
+        ---
+        directory     (str)  : Working directory for terraform
+        state         (str)  : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
+        region        (str)  : Deployment region for backend configuration
+        configuration (str)  : Configuration file to use for terraform configuration (tfvars)
+        key           (str)  : Key of the task inputs and state version, that shall match when applying the plan
+        variables     (str)  : Additional variables to set via command line (secrets)
+        backend       (str)  : Local or s3 (shall match the terraform jobs configuration)
+        ---
+        Returns       (bool) : True if the plan was saved
+        """
+
+        is_status_ok = True
+
+        try :
+
+            plan = self.plan_file(directory, state, backend)
+            if plan is None : raise Exception('Plans can only be saved in a cache directory')
+
+            environment = self.environment(directory, state, backend)
+            logfile = self.logfile(directory, state, backend)
+            if logfile is not None and path.isfile(logfile) : remove(logfile)
+            # Terraform writes its lock file and local data in the workspace, not in the shared working directory
+            with self.workspace(directory, state, backend) as workdir :
+                if not await self.init_async(directory, state, bucket, region, backend, environment, workdir) : raise Exception('Initialization failed')
+
+                self.forget_plan(directory, state, backend)
+
+                log.info("-------- Planning deployment for a later application")
+                cmd = ['terraform', 'plan', '-no-color', '-out=' + plan, '-input=false'] + self.arguments(state, configuration, variables)
+                with self.measure('plan', state) as record : record['success'] = await self.execute_async(cmd, workdir, environment, logfile, self.timeout('plan'))
+                if not record['success'] : raise Exception('Planification failed')
+
+                # The plan embeds the secret variables. Its key is written last, so that an incomplete plan never matches
+                chmod(plan, 0o600)
+                with open(plan + '.key', 'w', encoding='UTF-8') as fid : fid.write(key)
+                log.info("-------- Plan saved in %s", plan)
 
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
-# pylint: enable=C0301, W0102, R0913, R0914, C0321, R1732
+# pylint: enable=C0301, R0913, R0917, R0914, C0321
 
-# pylint: disable=C0301, C0321, W0102, R0913, R0914, R1732
-    def destroy(self, directory, state, bucket, region, configuration, variables = {}, backend='local') :
+# pylint: disable=C0301, C0321, R0913, R0917, R0914
+    async def destroy_async(self, directory, state, bucket, region, configuration, variables = None, backend='local') :
         """ Destroy an existing configuration
         ---
-        directory     (str) : Working directory for terraform
-        state         (str) : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
-        region        (str) : Deployment region for backend configuration
-        configuration (str) : Configuration file to use for terraform configuration (tfvars)
-        variables     (str) : Additional variables to set via command line (secrets)
-        backend       (str) : Local or s3 (shall match the terraform jobs configuration)
+        directory     (str)  : Working directory for terraform
+        state         (str)  : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
+        region        (str)  : Deployment region for backend configuration
+        configuration (str)  : Configuration file to use for terraform configuration (tfvars)
+        variables     (str)  : Additional variables to set via command line (secrets)
+        backend       (str)  : Local or s3 (shall match the terraform jobs configuration)
+        ---
+        Returns       (bool) : True if the configuration was destroyed
         """
 
         is_status_ok = True
 
         try :
-            tf_data_dir = directory + '/.terraform'
-            if path.exists(tf_data_dir) : rmtree(tf_data_dir)
-            if path.exists(tf_data_dir + '.lock.hcl') : remove(tf_data_dir + '.lock.hcl')
+            environment = self.environment(directory, state, backend)
+            logfile = self.logfile(directory, state, backend)
+            if logfile is not None and path.isfile(logfile) : remove(logfile)
+            # Terraform writes its lock file and local data in the workspace, not in the shared working directory
+            with self.workspace(directory, state, backend) as workdir :
+                if not await self.init_async(directory, state, bucket, region, backend, environment, workdir) : raise Exception('Initialization failed')
+
+                log.info("-------- Destroying deployment")
+                cmd = ['terraform', 'destroy', '-no-color', '-input=false', '--auto-approve'] + self.arguments(state, configuration, variables)
+                with self.measure('destroy', state) as record : record['success'] = await self.execute_async(cmd, workdir, environment, logfile, self.timeout('destroy'))
+                forget_state_outputs(state)
+                if not record['success'] : raise Exception('Destruction failed')
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0301, C0321, R0913, R0917, R0914
+
+# pylint: disable=C0301, R0913, R0917, R0914, C0321
+    async def plan_async(self, directory, state, bucket, region, configuration, variables = None, backend='local') :
+        """ Initialize and plan terraform on a given configuration, without applying anything
+        ---
+        directory     (str)  : Working directory for terraform
+        state         (str)  : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
+        region        (str)  : Deployment region for backend configuration
+        configuration (str)  : Configuration file to use for terraform configuration (tfvars)
+        variables     (str)  : Additional variables to set via command line (secrets)
+        backend       (str)  : Local or s3 (shall match the terraform jobs configuration)
+        ---
+        Returns       (dict) : Plan summary, with drift set if the infrastructure differs from the configuration
+                               and the number of resources to add, change and destroy. None if planning failed
+        """
+
+        result = None
+
+        try :
+
+            environment = self.environment(directory, state, backend)
+            logfile = self.logfile(directory, state, backend)
+            if logfile is not None and path.isfile(logfile) : remove(logfile)
+            # Terraform writes its lock file and local data in the workspace, not in the shared working directory
+            with self.workspace(directory, state, backend) as workdir :
+                if not await self.init_async(directory, state, bucket, region, backend, environment, workdir) : raise Exception('Initialization failed')
+
+                summary = {'drift' : False, 'add' : 0, 'change' : 0, 'destroy' : 0}
+                def count(line) :
+                    if line.startswith('Plan:') :
+                        for (number, action) in plan_pattern.findall(line) : summary[action] = int(number)
+
+                log.info("-------- Checking deployment drift")
+                cmd = ['terraform', 'plan', '-no-color', '-input=false', '-detailed-exitcode'] + self.arguments(state, configuration, variables)
+                with self.measure('plan', state) as record :
+                    code = await self.run_async(cmd, workdir, environment, logfile, self.timeout('plan'), count, (0, 2))
+                    record['success'] = code in (0, 2)
+                # Detailed exit code is 0 without changes, 2 with changes and 1 on error
+                if code not in (0, 2) : raise Exception('Planification failed')
+                summary['drift'] = (code == 2)
+                result = summary
+
+        except Exception as exc :
+            log.error(str(exc))
+            result = None
+
+        return result
+# pylint: enable=C0301, R0913, R0917, R0914, C0321
+
+# pylint: disable=C0301, C0321
+    def arguments(self, state, configuration, variables) :
+        """ Build the variables and state arguments shared by plan and destroy commands
+        ---
+        state         (str)  : State file to use for storage
+        configuration (str)  : Configuration file to use for terraform configuration (tfvars)
+        variables     (dict) : Additional variables to set via command line (secrets)
+        ---
+        Returns       (list) : Command line arguments, passed as is to terraform without shell quoting
+        """
 
-            other_parameters = ''
+        result = ['-var-file=' + configuration, '-var=region=' + self.m_region, '-var=access_key=' + self.m_access_key, '-var=secret_key=' + self.m_secret_key, '-state=' + state]
+        if variables is not None :
             for key in variables :
-                other_parameters = other_parameters + ' -var="' + key + '=' + variables[key] + '"'
+                result.append('-var=' + key + '=' + variables[key])
+
+        return result
+
+    def environment(self, directory, state, backend) :
+        """ Build the environment of the terraform processes of a task
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Returns      (dict) : Process environment, with git configuration, and with plugin cache and persistent
+                              data directory when a cache directory is configured
+        """
+
+        result = git_environment(self.m_git, environ)
+
+        if self.m_cache is not None :
+            result['TF_PLUGIN_CACHE_DIR'] = self.m_cache + '/plugins'
+            result['TF_DATA_DIR'] = self.m_cache + '/data/' + self.identifier(directory, state, backend)
+
+        return result
+
+    def logfile(self, directory, state, backend) :
+        """ Build the name of the compressed file logging the terraform outputs of a task
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Returns       (str) : Log file in the cache directory, None if no cache directory is configured
+        """
+
+        result = None
+
+        if self.m_cache is not None :
+            makedirs(self.m_cache + '/logs', exist_ok=True)
+            result = self.m_cache + '/logs/' + self.identifier(directory, state, backend) + '.log.gz'
+
+        return result
+
+    def configuration_file(self, directory, state, backend) :
+        """ Build the name of the terraform configuration file (tfvars) of a task
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Returns       (str) : File in the task terraform data directory, in the working directory if no cache
+                              directory is configured (conf.tfvars, or conf.tfvars.json in json format)
+        """
+
+        filename = 'conf.tfvars'
+        if self.m_tfvars_format == 'json' : filename = 'conf.tfvars.json'
+
+        result = directory + '/' + filename
+
+        if self.m_cache is not None :
+            makedirs(self.m_cache + '/data/' + self.identifier(directory, state, backend), exist_ok=True)
+            result = self.m_cache + '/data/' + self.identifier(directory, state, backend) + '/' + filename
+
+        return result
+
+    def plan_file(self, directory, state, backend) :
+        """ Build the name of the file in which the plan of a task is saved between runs
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Returns       (str) : Plan file in the cache directory, None if no cache directory is configured
+        """
+
+        result = None
+
+        if self.m_cache is not None :
+            makedirs(self.m_cache + '/plans', mode=0o700, exist_ok=True)
+            result = self.m_cache + '/plans/' + self.identifier(directory, state, backend) + '.tfplan'
+
+        return result
+
+    def saved_plan(self, directory, state, backend, key) :
+        """ Look for the plan saved by a previous run for the same task inputs and state version
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        key           (str) : Key of the task inputs and state version
+        ---
+        Returns       (str) : Saved plan file, None if no plan was saved or if it was saved for another key
+        """
+
+        result = None
+
+        plan = self.plan_file(directory, state, backend)
+        if plan is not None and path.isfile(plan) and path.isfile(plan + '.key') :
+            with open(plan + '.key', 'r', encoding='UTF-8') as fid :
+                if fid.read() == key : result = plan
+            if result is None : log.info("-------- Inputs or state changed since the plan was saved - Planning again")
+
+        return result
+
+    def forget_plan(self, directory, state, backend) :
+        """ Remove the plan saved for a task, if any
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        """
+
+        plan = self.plan_file(directory, state, backend)
+        if plan is not None :
+            for filename in [plan + '.key', plan] :
+                if path.isfile(filename) : remove(filename)
+
+# pylint: disable=C0321
+    @contextmanager
+    def workspace(self, directory, state, backend) :
+        """ Build a scratch workspace in which terraform can run a task without writing in its working directory.
+        The terraform root is mirrored with symbolic links, except on the path to the working directory, so that local
+        modules relative sources still resolve. The lock file is copied, and copied back if terraform updated it
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Yields        (str) : Working directory in the workspace, or the working directory itself if workspaces are
+                              not configured or if it is outside the terraform root
+        """
+
+        relative = None
+        if self.m_root is not None :
+            relative = path.relpath(path.realpath(directory), self.m_root)
+            if relative == '..' or relative.startswith('..' + sep) : relative = None
+
+        if relative is None : yield directory
+        else :
+            base = gettempdir()
+            if self.m_cache is not None :
+                base = self.m_cache + '/workspaces'
+                makedirs(base, exist_ok=True)
+            scratch = mkdtemp(prefix=self.identifier(directory, state, backend) + '-', dir=base)
+
+            try :
+                source = self.m_root
+                target = scratch
+                parts = [part for part in relative.split(sep) if part not in ('', '.')]
+                for part in parts + [None] :
+                    for entry in listdir(source) :
+                        if part is None and entry in ('.terraform', '.terraform.lock.hcl') : continue
+                        if entry != part : symlink(source + '/' + entry, target + '/' + entry)
+                    if part is not None :
+                        source = source + '/' + part
+                        target = target + '/' + part
+                        makedirs(target)
+                if path.isfile(source + '/.terraform.lock.hcl') : copyfile(source + '/.terraform.lock.hcl', target + '/.terraform.lock.hcl')
+
+                yield target
+
+                # Keep the provider selections made by terraform, replacing the lock file at once
+                if path.isfile(target + '/.terraform.lock.hcl') and not self.same_file(target + '/.terraform.lock.hcl', source + '/.terraform.lock.hcl') :
+                    copyfile(target + '/.terraform.lock.hcl', source + '/.terraform.lock.hcl.' + path.basename(scratch))
+                    replace(source + '/.terraform.lock.hcl.' + path.basename(scratch), source + '/.terraform.lock.hcl')
+
+            finally :
+                rmtree(scratch, ignore_errors=True)
+# pylint: enable=C0321
+
+# pylint: disable=R0201, C0321
+    def same_file(self, first, second) :
+        """ Tests if two files have the same content
+        ---
+        first   (str)  : First file
+        second  (str)  : Second file, that may not exist
+        ---
+        Returns (bool) : True if both files exist with the same content
+        """
+
+        result = False
+
+        if path.isfile(second) :
+            with open(first, 'rb') as fid : content = fid.read()
+            with open(second, 'rb') as fid : result = (fid.read() == content)
+
+        return result
+# pylint: enable=R0201, C0321
+
+# pylint: disable=R0201
+    def identifier(self, directory, state, backend) :
+        """ Build a readable and unique identifier for a task
+        ---
+        directory     (str) : Working directory for terraform
+        state         (str) : State file to use for storage
+        backend       (str) : Local or s3
+        ---
+        Returns       (str) : Identifier made of the working directory name and a hash of the task features
+        """
+
+        digest = sha256((path.abspath(directory) + '|' + state + '|' + backend).encode('UTF-8')).hexdigest()
+        result = path.basename(path.normpath(directory)) + '-' + digest[:16]
+
+        return result
+# pylint: enable=R0201
+
+# pylint: disable=C0321
+    def measure(self, phase, state) :
+        """ Measure the duration of a terraform phase, if timings are recorded, labelled as the task it belongs to
+        ---
+        phase   (str)            : Terraform phase (init, plan, apply, destroy)
+        state   (str)            : State file of the task
+        ---
+        Returns (ContextManager) : Context yielding the phase record, which success feature shall be set
+        """
+
+        result = nullcontext({'success' : True})
+        if self.m_timings is not None : result = self.m_timings.measure(phase, state=path.basename(state))
+
+        return result
+
+    def timeout(self, phase) :
+        """ Maximum duration of a terraform phase
+        ---
+        phase   (str)   : Terraform phase (init, plan, apply, destroy)
+        ---
+        Returns (float) : Phase timeout in seconds, None for no limit
+        """
+
+        result = self.m_timeouts.get(phase)
+
+        return result
+
+# pylint: disable=R0913, R0917
+    async def execute_async(self, cmd, directory, environment, logfile, timeout = None) :
+        """ Run a terraform command, streaming its outputs to the logs
+        ---
+        cmd           (list)  : Command to run, as a list of arguments
+        directory     (str)   : Working directory for terraform
+        environment   (dict)  : Environment of the terraform process
+        logfile       (str)   : Compressed file to append outputs into (None for no log file)
+        timeout       (float) : Maximum duration of the command in seconds (None for no limit)
+        ---
+        Returns       (bool)  : True if the command succeeded
+        """
+
+        result = (await self.run_async(cmd, directory, environment, logfile, timeout) == 0)
+
+        return result
+
+    async def run_async(self, cmd, directory, environment, logfile, timeout = None, callback = None, codes = (0,)) :
+        """ Run a terraform command without shell, streaming its outputs to the logs, and logging its last outputs on failure
+        ---
+        cmd           (list)  : Command to run, as a list of arguments
+        directory     (str)   : Working directory for terraform
+        environment   (dict)  : Environment of the terraform process
+        logfile       (str)   : Compressed file to append outputs into (None for no log file)
+        timeout       (float) : Maximum duration of the command in seconds (None for no limit). On timeout or cancellation,
+                                terraform is interrupted with SIGINT, then SIGTERM, and an exception is raised
+        callback      (func)  : Function called with each stdout line (None for no callback)
+        codes         (tuple) : Return codes of a successful command
+        ---
+        Returns       (int)   : Command return code
+        """
+
+        log.debug('-------- Command : %s', ' '.join(cmd))
+        process = Process(cmd, directory, environment, logfile, log, shell=False, callback=callback)
+        result = await process.run_async(timeout, self.m_grace)
+        if result not in codes : log.error(process.get_tail())
+
+        return result
+# pylint: enable=R0913, R0917
+# pylint: enable=C0301, C0321
+
+# pylint: disable=C0301, R0913, R0917, R0914, C0321
+    async def init_async(self, directory, state, bucket, region, backend, environment, workdir = None) :
+        """ Initialize terraform, unless the backend configuration and module sources did not change since last initialization
+        ---
+        directory     (str)  : Working directory for terraform
+        state         (str)  : State file to use for storage (filename for local backend, s3 object name with path for s3 backend )
+        bucket        (str)  : Bucket hosting the states for s3 backend
+        region        (str)  : Deployment region for backend configuration
+        backend       (str)  : Local or s3 (shall match the terraform jobs configuration)
+        environment   (dict) : Environment of the terraform process
+        workdir       (str)  : Directory in which terraform runs, for example a scratch workspace of the working directory
+                               (working directory if None). The task logs stay identified by the working directory
+        """
+
+        is_status_ok = True
+
+        try :
+
+            if workdir is None : workdir = directory
 
-            log.info("-------- Initializing terraform for backend %s", backend)
             if backend == 'local' :
-                cmd = 'terraform init -input=false -backend-config="path=' + state + '"'
+                cmd = ['terraform', 'init', '-input=false', '-backend-config=path=' + state]
             elif backend == 's3' :
-                cmd = 'terraform init -input=false -backend-config="bucket=' + bucket + ' -backend-config="key=' + state + '" -backend-config="region=' + region + '""'
+                cmd = ['terraform', 'init', '-input=false', '-backend-config=bucket=' + bucket, '-backend-config=key=' + state, '-backend-config=region=' + region]
             else : raise Exception('Unmanaged backend type ' + backend)
-            log.debug('-------- Command : %s', cmd)
-            process = Popen(cmd, cwd=directory, stdout=PIPE, shell=True)
-            (output,err) = process.communicate()
-            log.debug(output)
-            if process.returncode > 0 :
-                log.error(err)
-                raise Exception('Initialization failed')
-
-            log.info("-------- Destroying deployment")
-            cmd = 'terraform destroy -no-color -input=false --auto-approve -var-file=' + configuration + ' -var="region=' + self.m_region + '" -var="access_key=' + self.m_access_key + '" -var="secret_key=' + self.m_secret_key + '" -state=' + state + other_parameters
-            log.debug('-------- Command : %s', cmd)
-            process = Popen(cmd, cwd=directory, stdout=PIPE, shell=True)
-            (output,err) = process.communicate()
-            log.debug(output)
-            if process.returncode > 0 :
-                log.error(err)
-                raise Exception('Destruction failed')
+
+            marker = None
+            shall_init = True
+            if 'TF_DATA_DIR' in environment : marker = environment['TF_DATA_DIR'] + '/orchestrator.init'
+
+            if marker is not None and path.isfile(marker) :
+                with open(marker, 'r', encoding='UTF-8') as fid :
+                    shall_init = (fid.read() != self.init_fingerprint(workdir, cmd))
+                if shall_init : remove(marker)
+
+            if not shall_init : log.info("-------- Terraform already initialized for backend %s", backend)
+            else :
+                log.info("-------- Initializing terraform for backend %s", backend)
+                async with acquire(init_lock) :
+                    with self.measure('init', state) as record : record['success'] = await self.execute_async(cmd, workdir, environment, self.logfile(directory, state, backend), self.timeout('init'))
+                if not record['success'] : raise Exception('Initialization failed')
+
+                if marker is not None :
+                    with open(marker, 'w', encoding='UTF-8') as fid :
+                        fid.write(self.init_fingerprint(workdir, cmd))
 
         except Exception as exc :
             log.error(str(exc))
             is_status_ok = False
 
         return is_status_ok
-# pylint: enable=C0301, C0321, W0102, R0913, R0914, R1732
+# pylint: enable=C0301, R0913, R0917, R0914, C0321
+
+# pylint: disable=R0201, C0301, C0321
+    def init_fingerprint(self, directory, cmd) :
+        """ Fingerprint the inputs of a terraform initialization
+        ---
+        directory (str)  : Working directory for terraform
+        cmd       (list) : Initialization command, with its backend configuration
+        ---
+        Returns   (str)  : Hash of the command, the lock file and the module and provider sources
+        """
+
+        digest = sha256(' '.join(cmd).encode('UTF-8'))
+
+        for filename in sorted(listdir(directory)) :
+            if filename.endswith('.tf') or filename == '.terraform.lock.hcl' :
+                digest.update(filename.encode('UTF-8'))
+                with open(directory + '/' + filename, 'r', encoding='UTF-8') as fid :
+                    for line in fid :
+                        if filename == '.terraform.lock.hcl' or init_pattern.search(line) : digest.update(line.strip().encode('UTF-8'))
+
+        result = digest.hexdigest()
+
+        return result
+# pylint: enable=R0201, C0301, C0321
 
 # pylint: disable=C0321
     def recurse(self, item, level=0):
@@ -0,0 +1,162 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to record the durations of workflow steps, tasks and terraform phases
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import replace
+from time import perf_counter, time
+from threading import Lock
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Local includes
+from orchestrator.utils import dump_json_file
+
+# Logging configuration
+log = getLogger('timings')
+
+# Labels of the items being measured, inherited by the items measured within them
+current_labels = ContextVar('labels', default={})
+
+# pylint: disable=C0301, C0321
+class Timings :
+    """ Class recording wall-clock durations of the workflow items, and reporting them as json or as a prometheus textfile """
+
+    m_start     = None
+    m_epoch     = None
+    m_records   = None
+    m_lock      = None
+
+    def __init__(self) :
+        """ Constructor """
+        self.m_start    = perf_counter()
+        self.m_epoch    = time()
+        self.m_records  = []
+        self.m_lock     = Lock()
+
+    @contextmanager
+    def measure(self, kind, **labels) :
+        """ Measure the duration of the enclosed code
+        ---
+        kind    (str)  : Kind of item measured (workflow, task, init, plan, apply, destroy, ...)
+        labels  (dict) : Features identifying the item (step, task, state, ...), completing the enclosing items ones
+        ---
+        Yields  (dict) : Record of the measure, which success feature may be set by the enclosed code
+        """
+
+        record = {'kind' : kind, 'labels' : dict(current_labels.get(), **labels), 'start' : perf_counter() - self.m_start, 'duration' : 0, 'success' : True}
+        token = current_labels.set(record['labels'])
+
+        try :
+            yield record
+        except Exception :
+            record['success'] = False
+            raise
+        finally :
+            current_labels.reset(token)
+            record['duration'] = perf_counter() - self.m_start - record['start']
+            with self.m_lock : self.m_records.append(record)
+
+    @contextmanager
+    def labels(self, **labels) :
+        """ Label the items measured within the enclosed code, when it is not measured itself
+        ---
+        labels  (dict) : Features identifying the enclosed code (environment, step, task, ...)
+        """
+
+        token = current_labels.set(dict(current_labels.get(), **labels))
+
+        try :
+            yield
+        finally :
+            current_labels.reset(token)
+
+    def get_records(self) :
+        """ Records accessor
+        ---
+        Returns (list) : Records of all the measures, with steps spans computed from their tasks
+        """
+
+        with self.m_lock :
+            result = list(self.m_records)
+
+        # Steps tasks may run in parallel, so a step lasts from its first task start to its last task end
+        steps = {}
+        for record in result :
+            if record['kind'] == 'task' :
+                key = (record['labels'].get('environment'), record['labels']['step'])
+                if key not in steps : steps[key] = {'kind' : 'step', 'labels' : {'step' : key[1]}, 'start' : record['start'], 'end' : record['start'] + record['duration'], 'success' : True}
+                steps[key]['start'] = min(steps[key]['start'], record['start'])
+                steps[key]['end'] = max(steps[key]['end'], record['start'] + record['duration'])
+                steps[key]['success'] = steps[key]['success'] and record['success']
+                if key[0] is not None : steps[key]['labels']['environment'] = key[0]
+        for step in steps.values() :
+            result.append({'kind' : 'step', 'labels' : step['labels'], 'start' : step['start'], 'duration' : step['end'] - step['start'], 'success' : step['success']})
+
+        return result
+
+    def write_report(self, filename) :
+        """ Write the records in a json report
+        ---
+        filename (str) : Json file to write
+        """
+
+        is_status_ok = True
+
+        try :
+            report = {'start' : self.m_epoch, 'duration' : perf_counter() - self.m_start, 'records' : self.get_records()}
+            dump_json_file(report, filename)
+            log.info('Timings report written to %s', filename)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+
+    def write_prometheus(self, filename) :
+        """ Write the records in the prometheus node exporter textfile format. The exporter rejects duplicated series,
+        so the records of a same item (a retried phase, or a state planned twice) are summed into a single series,
+        successful only if all of them were
+        ---
+        filename (str) : Textfile to write, replaced at once so that the exporter never reads a partial file
+        """
+
+        is_status_ok = True
+
+        try :
+            series = {}
+            for record in self.get_records() :
+                key = tuple(sorted(dict(record['labels'], kind=record['kind']).items()))
+                if key not in series : series[key] = {'duration' : 0, 'success' : True}
+                series[key]['duration'] = series[key]['duration'] + record['duration']
+                series[key]['success'] = series[key]['success'] and record['success']
+
+            lines = [ \
+                '# HELP orchestrator_duration_seconds Wall-clock duration of orchestrator workflows, steps, tasks and terraform phases', \
+                '# TYPE orchestrator_duration_seconds gauge']
+            for key, value in series.items() :
+                labels = dict(key)
+                labels['success'] = str(value['success']).lower()
+                text = ','.join(name + '="' + str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, label in sorted(labels.items()))
+                lines.append('orchestrator_duration_seconds{' + text + '} ' + format(value['duration'], '.3f'))
+
+            with open(filename + '.tmp', 'w', encoding='UTF-8') as fid : fid.write('\n'.join(lines) + '\n')
+            replace(filename + '.tmp', filename)
+            log.info('Prometheus timings written to %s', filename)
+
+        except Exception as exc :
+            log.error(str(exc))
+            is_status_ok = False
+
+        return is_status_ok
+# pylint: enable=C0301, C0321
@@ -10,12 +10,27 @@
 # Latest revision: 04 october 2021
 # --------------------------------------------------- """
 
-from json import load, dump
+from json import load, dump, JSONDecoder, JSONDecodeError
 from logging import getLogger
+from os import path, listdir, stat, environ
+from re import compile as regex
+from threading import Lock
+from copy import deepcopy
 
 # Logging configuration
 log = getLogger('utils')
 
+# Module source declaration in terraform files
+source_pattern = regex(r'\bsource\s*=\s*"([^"]*)"')
+
+# Serial and lineage features of terraform state files, located in their first lines
+serial_pattern = regex(r'"serial"\s*:\s*(\d+)')
+lineage_pattern = regex(r'"lineage"\s*:\s*"([^"]*)"')
+
+# Outputs of the state files already read, with the modification time and size they were read at
+state_outputs = {}
+state_outputs_lock = Lock()
+
 # pylint: disable=C0301, C0321
 def load_and_parse_json_file(filename, heading = '') :
     """ Load and parse a json file """
@@ -38,6 +53,114 @@ def dump_json_file(content, filename, heading = '') :
 
     fid.close()
 
+def load_state_outputs(filename) :
+    """ Read the outputs of a terraform state file, caching them until the file changes
+    ---
+    filename (str)  : Terraform state file
+    ---
+    Returns  (dict) : Content of the top-level outputs object of the state
+    """
+
+    key = path.realpath(filename)
+    status = stat(key)
+    version = (status.st_mtime_ns, status.st_size)
+
+    with state_outputs_lock :
+        cached = state_outputs.get(key)
+
+    if cached is not None and cached[0] == version :
+        log.debug('Reusing outputs of state : %s', filename)
+        result = cached[1]
+    else :
+        log.debug('Parsing outputs of state : %s', filename)
+        result = parse_state_outputs(key)
+        with state_outputs_lock : state_outputs[key] = (version, result)
+
+    # Callers get their own copy, so that the cached outputs are never modified
+    result = deepcopy(result)
+
+    return result
+
+def forget_state_outputs(filename) :
+    """ Remove the cached outputs of a state file, for example once terraform wrote it
+    ---
+    filename (str) : Terraform state file
+    """
+
+    with state_outputs_lock : state_outputs.pop(path.realpath(filename), None)
+
+# pylint: disable=R0912, R0915
+def parse_state_outputs(filename, chunk = 1 << 16) :
+    """ Parse the top-level outputs object of a terraform state file, without reading the rest of the file.
+    Terraform writes the outputs before the resources, so only the state header and its outputs are decoded
+    ---
+    filename (str)  : Terraform state file
+    chunk    (int)  : Number of characters read at once, doubled each time a value is incomplete
+    ---
+    Returns  (dict) : Content of the outputs object, empty if the state has no outputs
+    """
+
+    result = {}
+    decoder = JSONDecoder()
+
+    with open(filename, 'r', encoding='UTF-8') as fid :
+
+        buffer = fid.read(chunk)
+        position = 0
+        is_over = (len(buffer) == 0)
+
+        # Expected tokens : opening brace, then key, colon, value and separator for each feature
+        expected = '{'
+        feature = None
+        while expected is not None :
+
+            while position < len(buffer) and buffer[position] in ' \t\r\n' : position = position + 1
+            if position == len(buffer) :
+                if is_over : raise Exception('Unexpected end of state file ' + filename)
+                more = fid.read(chunk)
+                is_over = (len(more) == 0)
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+
+            if expected in ('{', ':') :
+                if buffer[position] != expected : raise Exception('Invalid state file ' + filename)
+                position = position + 1
+                expected = 'key' if expected == '{' else 'value'
+            elif expected == 'separator' :
+                if buffer[position] == '}' : expected = None
+                elif buffer[position] == ',' : expected = 'key'
+                else : raise Exception('Invalid state file ' + filename)
+                position = position + 1
+            else :
+                if expected == 'key' and buffer[position] == '}' :
+                    expected = None
+                    continue
+                # Values may span several chunks, read until they can be decoded. A value ending with the
+                # buffer may be a truncated number, so it is decoded again with the next characters
+                try :
+                    (value, end) = decoder.raw_decode(buffer, position)
+                    if end == len(buffer) and not is_over : raise JSONDecodeError('Value may be truncated', buffer, end)
+                    position = end
+                except JSONDecodeError :
+                    if is_over : raise
+                    more = fid.read(chunk)
+                    is_over = (len(more) == 0)
+                    buffer = buffer[position:] + more
+                    position = 0
+                    chunk = chunk * 2
+                    continue
+                if expected == 'key' :
+                    feature = value
+                    expected = ':'
+                elif feature == 'outputs' :
+                    result = value
+                    expected = None
+                else : expected = 'separator'
+
+    return result
+# pylint: enable=R0912, R0915
+
 def remove_type_from_dictionary(linput, ltype) :
     """ Remove all object of the given type from input dictonary """
 
@@ -65,3 +188,105 @@ def remove_type_from_list(linput, ltype) :
 
     return result
 # pylint: enable=C0301, C0321
+
+# pylint: disable=C0301, C0321
+def list_module_sources(directory, visited = None) :
+    """ List the module sources used by the terraform files of a directory and its local modules
+    ---
+    directory (str)  : Directory containing terraform files
+    visited   (set)  : Local module directories already scanned
+    ---
+    Returns   (dict) : Local module directories (local) and remote module sources (remote)
+    """
+
+    result = {'local' : [], 'remote' : []}
+    if visited is None : visited = set()
+
+    visited.add(path.realpath(directory))
+
+    for filename in sorted(listdir(directory)) :
+        if filename.endswith('.tf') :
+            with open(directory + '/' + filename, 'r', encoding='UTF-8') as fid :
+                for source in source_pattern.findall(fid.read()) :
+                    if source.startswith('./') or source.startswith('../') :
+                        module = path.normpath(directory + '/' + source)
+                        if path.realpath(module) not in visited and path.isdir(module) :
+                            result['local'].append(module)
+                            found = list_module_sources(module, visited)
+                            result['local'] = result['local'] + found['local']
+                            result['remote'] = result['remote'] + found['remote']
+                    elif source not in result['remote'] : result['remote'].append(source)
+
+    return result
+
+def parse_git_source(source) :
+    """ Extract the repository and reference of a git module source
+    ---
+    source  (str)   : Terraform module source
+    ---
+    Returns (tuple) : Repository url and reference (None if not set), None if the source is not a git repository
+    """
+
+    result = None
+
+    url = source
+    if url.startswith('git::') : url = url[len('git::'):]
+    elif url.startswith('github.com/') : url = 'https://' + url
+    elif not url.startswith('git@') : url = None
+
+    if url is not None :
+        reference = None
+        if '?' in url :
+            (url, query) = url.split('?', 1)
+            for parameter in query.split('&') :
+                if parameter.startswith('ref=') : reference = parameter[len('ref='):]
+        # Remove module subdirectory, keeping the scheme separator
+        scheme = ''
+        if '://' in url : (scheme, url) = url.split('://', 1)
+        url = url.split('//', 1)[0]
+        if scheme != '' : url = scheme + '://' + url
+        if source.startswith('github.com/') and not url.endswith('.git') : url = url + '.git'
+        result = (url, reference)
+
+    return result
+
+def git_environment(entries, base = None) :
+    """ Build a process environment providing git configuration entries, without modifying any git configuration file
+    ---
+    entries (list) : Git configuration keys and values
+    base    (dict) : Environment to extend (current environment if None)
+    ---
+    Returns (dict) : Environment with the entries appended to the GIT_CONFIG_COUNT, GIT_CONFIG_KEY_n and GIT_CONFIG_VALUE_n variables
+    """
+
+    if base is None : base = environ
+    result = dict(base)
+
+    count = int(result.get('GIT_CONFIG_COUNT', '0'))
+    for (key, value) in entries :
+        result['GIT_CONFIG_KEY_' + str(count)] = key
+        result['GIT_CONFIG_VALUE_' + str(count)] = value
+        count = count + 1
+    result['GIT_CONFIG_COUNT'] = str(count)
+
+    return result
+
+def parse_state_serial(header) :
+    """ Extract the version of a terraform state from its first bytes
+    ---
+    header  (bytes) : First bytes of the state file, None if the state does not exist
+    ---
+    Returns (str)   : State lineage and serial separated by a colon, empty if the state does not exist
+    """
+
+    result = ''
+
+    if header is not None and len(header.strip()) > 0 :
+        text = header.decode('UTF-8', 'replace')
+        serial = serial_pattern.search(text)
+        lineage = lineage_pattern.search(text)
+        if serial is None or lineage is None : raise Exception('Unable to find serial and lineage in state header')
+        result = lineage.group(1) + ':' + serial.group(1)
+
+    return result
+# pylint: enable=C0301, C0321
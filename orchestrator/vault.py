@@ -0,0 +1,130 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Class to read secrets from a running vault agent
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from logging import getLogger
+from os import path, getenv, getuid
+from json import dumps, loads
+from socket import socket, AF_UNIX, SOCK_STREAM
+from threading import Lock
+from tempfile import gettempdir
+
+# Logging configuration
+log = getLogger('vault')
+
+# pylint: disable=C0301, C0321
+def default_socket() :
+    """ Default vault agent socket
+    ---
+    Returns (str) : Socket set in ORCHESTRATOR_AGENT_SOCKET, or agent.sock in a user private directory
+    """
+
+    result = getenv('ORCHESTRATOR_AGENT_SOCKET')
+
+    if result is None :
+        directory = getenv('XDG_RUNTIME_DIR')
+        if directory is None : directory = gettempdir()
+        result = directory + '/orchestrator-' + str(getuid()) + '/agent.sock'
+
+    return result
+
+class VaultClient :
+    """ Class requesting vault entries to a vault agent through its unix socket """
+
+    m_socket_path   = None
+    m_database      = None
+    m_socket        = None
+    m_reader        = None
+    m_lock          = None
+
+    def __init__(self, socket_path = None) :
+        """ Constructor
+        ---
+        socket_path (str) : Vault agent socket (default socket if None, empty to disable the agent)
+        """
+        self.m_socket_path  = socket_path
+        self.m_database     = None
+        self.m_socket       = None
+        self.m_reader       = None
+        self.m_lock         = Lock()
+        if self.m_socket_path is None : self.m_socket_path = default_socket()
+
+    def __del__(self) :
+        """ Destructor """
+        self.close()
+
+    def connect(self, database) :
+        """ Connect to the agent and check it serves the expected database
+        ---
+        database (str)  : Keepass database the secrets shall come from
+        ---
+        Returns  (bool) : True if the agent is reachable and serves the database
+        """
+
+        result = False
+
+        try :
+            if self.m_socket_path != '' and path.exists(self.m_socket_path) :
+                self.m_database = path.realpath(database)
+                self.m_socket = socket(AF_UNIX, SOCK_STREAM)
+                self.m_socket.connect(self.m_socket_path)
+                self.m_reader = self.m_socket.makefile('r', encoding='UTF-8')
+                result = self.request({'database' : self.m_database, 'ping' : True}).get('ok', False)
+
+        except Exception as exc :
+            log.debug('Vault agent not reachable on %s : %s', self.m_socket_path, str(exc))
+            result = False
+
+        if not result : self.close()
+
+        return result
+
+    def close(self) :
+        """ Close the connection to the agent """
+
+        if self.m_reader is not None : self.m_reader.close()
+        if self.m_socket is not None : self.m_socket.close()
+        self.m_reader = None
+        self.m_socket = None
+
+    def lookup(self, entry, feature) :
+        """ Read an entry feature from the agent
+        ---
+        entry   (str) : Entry path in the vault (groups and title separated by /)
+        feature (str) : Entry feature to read (username, password, ...)
+        ---
+        Returns (str) : Feature value
+        """
+
+        response = self.request({'database' : self.m_database, 'path' : entry, 'feature' : feature})
+        if 'error' in response : raise Exception(response['error'])
+        result = response['value']
+
+        return result
+
+    def request(self, message) :
+        """ Send a request to the agent and wait for its response
+        ---
+        message (dict) : Request to send
+        ---
+        Returns (dict) : Agent response
+        """
+
+        with self.m_lock :
+            self.m_socket.sendall((dumps(message) + '\n').encode('UTF-8'))
+            line = self.m_reader.readline()
+
+        if line == '' : raise Exception('Vault agent closed the connection')
+        result = loads(line)
+
+        return result
+# pylint: enable=C0301, C0321
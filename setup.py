@@ -26,6 +26,7 @@ setup(
     license = "MIT",
     keywords = "terraform ansible python iac orchestrator",
     install_requires=[ 'boto3>=1.21.43', 'pykeepass>=4.0.1', 'ipaddress>=1.0.3' ],
+    extras_require={ 'benchmark' : [ 'moto>=5.0.0' ] },
     classifiers=[
         'Programming Language :: Python',
         'Intended Audience :: Testers',
@@ -0,0 +1,55 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Allocator class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main
+from ipaddress import IPv4Network
+
+# Local includes
+from orchestrator.allocator import Allocator
+
+# pylint: disable=C0301, C0321
+class AllocatorTest(TestCase) :
+    """ Tests of the cidr ranges allocation """
+
+    def test_allocate(self) :
+        """ Ranges are allocated at the lowest aligned free address once the deployed ranges are reserved """
+
+        allocator = Allocator(IPv4Network('10.0.0.0/24'))
+        allocator.reserve(IPv4Network('10.0.0.0/28'))
+        allocator.reserve(IPv4Network('10.0.0.32/27'))
+
+        self.assertEqual(allocator.allocate(27), IPv4Network('10.0.0.64/27'))
+        self.assertEqual(allocator.allocate(28), IPv4Network('10.0.0.16/28'))
+        self.assertEqual(allocator.allocate(26), IPv4Network('10.0.0.128/26'))
+        self.assertEqual(allocator.allocate(28), IPv4Network('10.0.0.96/28'))
+        self.assertEqual(allocator.allocate(26), IPv4Network('10.0.0.192/26'))
+        self.assertIsNone(allocator.allocate(27))
+        self.assertEqual(allocator.allocate(28), IPv4Network('10.0.0.112/28'))
+
+    def test_reserve(self) :
+        """ Reserved ranges are clipped to the network, and reserving a range twice has no effect """
+
+        allocator = Allocator(IPv4Network('10.0.1.0/24'))
+        allocator.reserve(IPv4Network('10.0.0.0/23'))
+        self.assertIsNone(allocator.allocate(28))
+
+        allocator = Allocator(IPv4Network('10.0.0.0/24'))
+        allocator.reserve(IPv4Network('10.0.0.0/25'))
+        allocator.reserve(IPv4Network('10.0.0.64/26'))
+        allocator.reserve(IPv4Network('10.0.0.128/26'))
+        self.assertEqual(allocator.allocate(26), IPv4Network('10.0.0.192/26'))
+        self.assertIsNone(allocator.allocate(32))
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
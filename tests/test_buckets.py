@@ -0,0 +1,51 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Buckets class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main, skipIf
+
+# Aws includes
+from boto3 import Session
+try :
+    from moto import mock_aws
+except ImportError :
+    mock_aws = None
+
+# Local includes
+from orchestrator.buckets import Buckets
+
+# pylint: disable=C0301, C0321
+@skipIf(mock_aws is None, 'moto is not installed')
+class BucketsTest(TestCase) :
+    """ Tests of the S3 buckets management """
+
+    def test_empty_bucket(self) :
+        """ Empty a versioned bucket holding more versions than two listing pages """
+
+        with mock_aws() :
+            client = Session(aws_access_key_id='testing', aws_secret_access_key='testing', region_name='eu-west-1').client('s3')
+            client.create_bucket(Bucket='tests', CreateBucketConfiguration={'LocationConstraint' : 'eu-west-1'})
+            client.put_bucket_versioning(Bucket='tests', VersioningConfiguration={'Status' : 'Enabled'})
+            for i_version in range(2500) : client.put_object(Bucket='tests', Key='object-' + str(i_version % 100), Body=b'tests')
+            for i_object in range(50) : client.delete_object(Bucket='tests', Key='object-' + str(i_object))
+
+            buckets = Buckets()
+            buckets.configure('testing', 'testing', 'eu-west-1')
+            buckets.m_max_workers = 1
+
+            self.assertTrue(buckets.empty_bucket('tests', 'eu-west-1'))
+            response = client.list_object_versions(Bucket='tests')
+            self.assertEqual(response.get('Versions', []) + response.get('DeleteMarkers', []), [])
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
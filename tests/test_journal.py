@@ -0,0 +1,57 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Journal class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main
+from tempfile import TemporaryDirectory
+
+# Local includes
+from orchestrator.journal import Journal
+
+# pylint: disable=C0301, C0321
+class JournalTest(TestCase) :
+    """ Tests of the run journal """
+
+    def test_resume(self) :
+        """ Resumed runs keep the tasks completed by the previous run, new runs start an empty journal """
+
+        with TemporaryDirectory() as directory :
+            journal = Journal()
+            self.assertTrue(journal.configure(directory + '/journals/dev.deployment.json'))
+            journal.record('s1.a', 'abc', 'L:1')
+
+            resumed = Journal()
+            self.assertTrue(resumed.configure(directory + '/journals/dev.deployment.json', True))
+            self.assertTrue(resumed.matches('s1.a', 'abc', 'L:1'))
+
+            restarted = Journal()
+            self.assertTrue(restarted.configure(directory + '/journals/dev.deployment.json'))
+            self.assertFalse(restarted.matches('s1.a', 'abc', 'L:1'))
+
+    def test_matches(self) :
+        """ Tasks only match with the same inputs and the same state version, and never without fingerprint """
+
+        with TemporaryDirectory() as directory :
+            journal = Journal()
+            self.assertTrue(journal.configure(directory + '/journal.json'))
+            journal.record('s1.a', 'abc', 'L:1')
+            journal.record('s1.b', None, 'L:1')
+
+            self.assertTrue(journal.matches('s1.a', 'abc', 'L:1'))
+            self.assertFalse(journal.matches('s1.a', 'abd', 'L:1'))
+            self.assertFalse(journal.matches('s1.a', 'abc', 'L:2'))
+            self.assertFalse(journal.matches('s1.b', None, 'L:1'))
+            self.assertFalse(journal.matches('s1.c', 'abc', 'L:1'))
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
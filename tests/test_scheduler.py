@@ -0,0 +1,107 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Scheduler class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main
+from threading import Barrier, Lock
+
+# Local includes
+from orchestrator.scheduler import Scheduler
+
+# pylint: disable=C0301, C0321
+class SchedulerTest(TestCase) :
+    """ Tests of the workflow dependency graph """
+
+    def test_build(self) :
+        """ Legacy workflows stay sequential, and unselected tasks are replaced by their dependencies """
+
+        workflow = { \
+            's1' : {'tasks' : [{'type' : 'terraform'}, {'type' : 'terraform'}]}, \
+            's2' : {'tasks' : [{'type' : 'terraform', 'name' : 'network'}]}, \
+            's3' : {'depends_on' : ['s1', 's2'], 'tasks' : [{'type' : 'python', 'depends_on' : ['s2.network']}, {'type' : 'python', 'depends_on' : []}]}}
+
+        scheduler = Scheduler()
+        self.assertTrue(scheduler.build(workflow, []))
+        self.assertEqual(scheduler.get_order(), ['s1.1', 's1.2', 's2.network', 's3.1', 's3.2'])
+        self.assertEqual(scheduler.get_dependencies('s1.2'), {'s1.1'})
+        self.assertEqual(scheduler.get_dependencies('s2.network'), {'s1.1', 's1.2'})
+        self.assertEqual(scheduler.get_dependencies('s3.1'), {'s1.1', 's1.2', 's2.network'})
+
+        self.assertTrue(scheduler.build(workflow, ['s1', 's3']))
+        self.assertEqual(scheduler.get_order(), ['s1.1', 's1.2', 's3.1', 's3.2'])
+        self.assertEqual(scheduler.get_dependencies('s3.2'), {'s1.1', 's1.2'})
+
+    def test_cycle(self) :
+        """ Workflows which tasks depend on each other can not be scheduled """
+
+        scheduler = Scheduler()
+        self.assertFalse(scheduler.build({'s1' : {'depends_on' : ['s2'], 'tasks' : [{'type' : 'python'}]}, 's2' : {'tasks' : [{'type' : 'python'}]}}, []))
+        self.assertFalse(scheduler.build({'s1' : {'tasks' : [{'type' : 'python', 'depends_on' : ['unknown']}]}}, []))
+
+    def test_run_parallel(self) :
+        """ Independent tasks run at the same time, dependent ones once their dependencies completed """
+
+        workflow = {'s1' : {'tasks' : [{'type' : 'python', 'depends_on' : []}, {'type' : 'python', 'depends_on' : []}]}, 's2' : {'tasks' : [{'type' : 'python'}]}}
+        barrier = Barrier(2, timeout=10)
+        applied = []
+        lock = Lock()
+
+        def function(identifier) :
+            if identifier.startswith('s1') : barrier.wait()
+            with lock : applied.append(identifier)
+            return True
+
+        scheduler = Scheduler()
+        self.assertTrue(scheduler.build(workflow, []))
+        self.assertTrue(scheduler.run(function, 2))
+        self.assertEqual(applied[-1], 's2.1')
+        self.assertEqual(len(applied), 3)
+
+    def test_run_failure(self) :
+        """ No task is launched once a task failed """
+
+        workflow = {'s1' : {'tasks' : [{'type' : 'python'}, {'type' : 'python', 'depends_on' : []}]}, 's2' : {'tasks' : [{'type' : 'python'}]}}
+        applied = []
+
+        scheduler = Scheduler()
+        self.assertTrue(scheduler.build(workflow, []))
+        self.assertFalse(scheduler.run(lambda identifier : applied.append(identifier) or identifier != 's1.1', 1))
+        self.assertEqual(applied, ['s1.1'])
+
+    def test_reverse(self) :
+        """ Terraform tasks are destroyed after the ones depending on them, python tasks only if they are applied first or last """
+
+        workflow = { \
+            's1' : {'tasks' : [{'type' : 'python', 'method' : 'define_networks', 'name' : 'cidr', 'on_destroy' : 'first'}, {'type' : 'terraform', 'name' : 'network'}]}, \
+            's2' : {'tasks' : [ \
+                {'type' : 'python', 'method' : 'copy_states_to_backend', 'name' : 'copy'}, \
+                {'type' : 'terraform', 'name' : 'buckets', 'pre_destroy' : [{'method' : 'empty_buckets', 'args' : {}}]}, \
+                {'type' : 'terraform', 'name' : 'dns', 'depends_on' : ['s2.copy']}, \
+                {'type' : 'python', 'method' : 'notify', 'name' : 'notify', 'on_destroy' : 'last'}]}}
+
+        destruction = Scheduler().reverse(workflow)
+        self.assertEqual(list(destruction), ['s2', 's1'])
+
+        scheduler = Scheduler()
+        self.assertTrue(scheduler.build(destruction, []))
+        self.assertEqual(sorted(scheduler.get_order()), ['s1.cidr', 's1.network', 's2.buckets', 's2.buckets-pre-destroy-1', 's2.dns', 's2.notify'])
+        self.assertEqual(scheduler.get_dependencies('s1.cidr'), set())
+        self.assertEqual(scheduler.get_dependencies('s2.buckets-pre-destroy-1'), {'s1.cidr'})
+        self.assertEqual(scheduler.get_dependencies('s2.buckets'), {'s2.buckets-pre-destroy-1'})
+        self.assertEqual(scheduler.get_dependencies('s2.dns'), {'s1.cidr'})
+        self.assertEqual(scheduler.get_dependencies('s1.network'), {'s1.cidr', 's2.buckets', 's2.dns'})
+        self.assertEqual(scheduler.get_dependencies('s2.notify'), {'s1.cidr', 's1.network', 's2.buckets', 's2.buckets-pre-destroy-1', 's2.dns'})
+        self.assertEqual(scheduler.get_node('s2.buckets-pre-destroy-1')['task']['method'], 'empty_buckets')
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,61 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# States class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main, skipIf
+from tempfile import TemporaryDirectory
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from os import listdir
+
+# Aws includes
+from boto3 import Session
+try :
+    from moto import mock_aws
+except ImportError :
+    mock_aws = None
+
+# Local includes
+from orchestrator.buckets import Buckets
+from orchestrator.states import States
+
+# pylint: disable=C0301, C0321
+@skipIf(mock_aws is None, 'moto is not installed')
+class StatesTest(TestCase) :
+    """ Tests of the states outputs reading """
+
+    def test_concurrent_s3_outputs(self) :
+        """ Tasks reading the same s3 state at the same time download it once """
+
+        with mock_aws(), TemporaryDirectory() as directory :
+            client = Session(aws_access_key_id='testing', aws_secret_access_key='testing', region_name='us-east-1').client('s3')
+            client.create_bucket(Bucket='states')
+            client.put_object(Bucket='states', Key='dev/network.tfstate', Body=dumps({'serial' : 1, 'outputs' : {'vpc' : {'value' : 'vpc-1'}}}).encode('UTF-8'))
+
+            buckets = Buckets()
+            buckets.configure('testing', 'testing', 'us-east-1')
+            downloads = []
+            get_object = buckets.m_client.get_object
+            buckets.m_client.get_object = lambda **kwargs : downloads.append(kwargs) or get_object(**kwargs)
+
+            states = States()
+            self.assertTrue(states.configure(buckets, directory + '/states'))
+            with ThreadPoolExecutor(max_workers=8) as executor :
+                outputs = list(executor.map(lambda _ : states.get_outputs('dev/network.tfstate', 's3', 'states'), range(16)))
+
+            self.assertEqual(outputs, [{'vpc' : {'value' : 'vpc-1'}}] * 16)
+            self.assertEqual(len(downloads), 1)
+            self.assertEqual(sorted(name[-5:] for name in listdir(directory + '/states')), ['.etag', 'state'])
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
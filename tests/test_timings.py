@@ -0,0 +1,58 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Timings class tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main
+from tempfile import TemporaryDirectory
+
+# Local includes
+from orchestrator.timings import Timings
+
+# pylint: disable=C0301, C0321
+class TimingsTest(TestCase) :
+    """ Tests of the timings records and reports """
+
+    def test_labels(self) :
+        """ Items measured within a task are labelled as the task """
+
+        timings = Timings()
+        with timings.measure('task', environment='dev', step='s1', task='A') :
+            with timings.measure('plan', state='a.tfstate') : pass
+        with timings.labels(environment='dev', step='s2') :
+            with timings.measure('plan', state='b.tfstate') : pass
+        with timings.measure('plan', state='c.tfstate') : pass
+
+        labels = [record['labels'] for record in timings.get_records() if record['kind'] == 'plan']
+        self.assertEqual(labels, [ \
+            {'environment' : 'dev', 'step' : 's1', 'task' : 'A', 'state' : 'a.tfstate'}, \
+            {'environment' : 'dev', 'step' : 's2', 'state' : 'b.tfstate'}, \
+            {'state' : 'c.tfstate'}])
+
+    def test_prometheus(self) :
+        """ Records of a same item are summed into a single series, failed if any of them failed """
+
+        timings = Timings()
+        for success in [False, True] :
+            with timings.measure('init', environment='dev', step='s1', state='a.tfstate') as record : record['success'] = success
+        with timings.measure('init', environment='dev', step='s1', state='b.tfstate') : pass
+
+        with TemporaryDirectory() as directory :
+            self.assertTrue(timings.write_prometheus(directory + '/timings.prom'))
+            with open(directory + '/timings.prom', 'r', encoding='UTF-8') as fid : lines = [line.rsplit(' ', 1)[0] for line in fid.read().splitlines() if not line.startswith('#')]
+
+        self.assertEqual(lines, [ \
+            'orchestrator_duration_seconds{environment="dev",kind="init",state="a.tfstate",step="s1",success="false"}', \
+            'orchestrator_duration_seconds{environment="dev",kind="init",state="b.tfstate",step="s1",success="true"}'])
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,64 @@
+""" -----------------------------------------------------
+# TECHNOGIX
+# -------------------------------------------------------
+# Copyright (c) [2022] Technogix SARL
+# All rights reserved
+# -------------------------------------------------------
+# Utils functions tests
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @18 october 2026
+# Latest revision: 18 october 2026
+# --------------------------------------------------- """
+
+# System includes
+from unittest import TestCase, main
+from tempfile import TemporaryDirectory
+from json import dumps
+
+# Local includes
+from orchestrator.utils import parse_state_outputs, load_state_outputs
+
+# pylint: disable=C0301, C0321
+class UtilsTest(TestCase) :
+    """ Tests of the utility functions """
+
+    def test_parse_state_outputs(self) :
+        """ Outputs are parsed whatever the number of characters read at once """
+
+        outputs = {'vpc' : {'value' : {'cidr' : '10.0.0.0/16', 'id' : 'vpc-1'}, 'type' : ['object', {}]}, 'count' : {'value' : 12345, 'type' : 'number'}, 'name' : {'value' : 'é"\\\\ }', 'type' : 'string'}}
+        state = {'version' : 4, 'terraform_version' : '1.5.0', 'serial' : 1234567, 'lineage' : 'abc', 'outputs' : outputs, 'resources' : [{'mode' : 'managed'}]}
+
+        with TemporaryDirectory() as directory :
+            for (name, text) in [('compact', dumps(state)), ('indented', dumps(state, indent=2)), ('truncated', dumps(state)[:dumps(state).index('"resources"')])] :
+                with open(directory + '/' + name + '.tfstate', 'w', encoding='UTF-8') as fid : fid.write(text)
+                for chunk in [1, 2, 3, 7, 1 << 16] :
+                    self.assertEqual(parse_state_outputs(directory + '/' + name + '.tfstate', chunk), outputs, name + ' state read by ' + str(chunk))
+
+    def test_parse_state_without_outputs(self) :
+        """ States without outputs have empty outputs, invalid states are rejected """
+
+        with TemporaryDirectory() as directory :
+            for (name, text) in [('empty', '{}'), ('resources', dumps({'version' : 4, 'serial' : 12, 'resources' : []}, indent=2))] :
+                with open(directory + '/' + name + '.tfstate', 'w', encoding='UTF-8') as fid : fid.write(text)
+                for chunk in [1, 2, 5, 1 << 16] :
+                    self.assertEqual(parse_state_outputs(directory + '/' + name + '.tfstate', chunk), {}, name + ' state read by ' + str(chunk))
+
+            for (name, text) in [('blank', ''), ('array', '[]'), ('unterminated', '{"version" : 4, "serial" : 1')] :
+                with open(directory + '/' + name + '.tfstate', 'w', encoding='UTF-8') as fid : fid.write(text)
+                with self.assertRaises(Exception) : parse_state_outputs(directory + '/' + name + '.tfstate', 2)
+
+    def test_load_state_outputs(self) :
+        """ Cached outputs are returned as copies and parsed again once the state changed """
+
+        with TemporaryDirectory() as directory :
+            with open(directory + '/state.tfstate', 'w', encoding='UTF-8') as fid : fid.write(dumps({'outputs' : {'a' : {'value' : 1}}}))
+            outputs = load_state_outputs(directory + '/state.tfstate')
+            outputs['a']['value'] = 2
+            self.assertEqual(load_state_outputs(directory + '/state.tfstate'), {'a' : {'value' : 1}})
+
+            with open(directory + '/state.tfstate', 'w', encoding='UTF-8') as fid : fid.write(dumps({'outputs' : {'a' : {'value' : 10}}}))
+            self.assertEqual(load_state_outputs(directory + '/state.tfstate'), {'a' : {'value' : 10}})
+# pylint: enable=C0301, C0321
+
+if __name__ == '__main__' :
+    main()